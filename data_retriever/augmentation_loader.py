@@ -0,0 +1,199 @@
+import os
+import time
+import argparse
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+try:
+    from data_retriever.data_transformer import MelanomaImagePreprocessor, init_worker
+    from data_retriever.packed_dataset import CLASS_NAMES, PackedSplit
+except ImportError:
+    from data_transformer import MelanomaImagePreprocessor, init_worker
+    from packed_dataset import CLASS_NAMES, PackedSplit
+
+# Per-process state used by AugmentationLoader workers
+_worker_preprocessor = None
+_worker_images = None
+
+
+def list_directory_split(split_dir):
+    """(path, label_index) for every image of a <split>/<class>/ folder, in a fixed order"""
+    items = []
+    for label_index, class_name in enumerate(CLASS_NAMES):
+        class_dir = os.path.join(split_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+                items.append((os.path.join(class_dir, filename), label_index))
+    return items
+
+
+def augmentation_seed(seed, epoch, index):
+    """Seed for one image in one epoch; independent of batch size, worker count and visiting order"""
+    return int(np.random.SeedSequence([seed, epoch, index]).generate_state(1)[0])
+
+
+def _set_loader_state(preprocessor, split_dir, packed):
+    global _worker_preprocessor, _worker_images
+    _worker_preprocessor = preprocessor
+    # Each worker maps the packed array itself, so only row numbers cross the process boundary
+    _worker_images = PackedSplit(split_dir).images if packed else None
+
+
+def _init_loader_worker(preprocessor, split_dir, packed):
+    init_worker(preprocessor)
+    _set_loader_state(preprocessor, split_dir, packed)
+
+
+def _load_batch(sources, seeds, augment):
+    """Reads one batch (image paths or packed rows), scales it to [0, 1] and augments each image"""
+    if _worker_images is not None:
+        # Sorted rows read the memmap front to back; the original order is restored afterwards
+        order = np.argsort(sources)
+        images = np.empty((len(sources),) + _worker_images.shape[1:], dtype=np.uint8)
+        images[order] = _worker_images[np.asarray(sources)[order]]
+    else:
+        images = np.stack([np.asarray(Image.open(path).convert("RGB")) for path in sources])
+
+    batch = images.astype(np.float32) / 255.0
+    if augment:
+        for i, seed in enumerate(seeds):
+            _worker_preprocessor.seed_augmentation(seed)
+            batch[i] = _worker_preprocessor.augmentation(image=batch[i])['image']
+    return batch
+
+
+class AugmentationLoader:
+    """
+    Batched training iterator over a prepared split that augments on the fly.
+
+    Every epoch draws fresh augmentations, so nothing augmented is written to disk. Images
+    are read and augmented by a pool of worker processes, with at most 2 * workers batches
+    in flight. The pool is started on first use and reused by later epochs; call close() or
+    use the loader as a context manager to stop it. Image i of epoch e is always augmented
+    with augmentation_seed(seed, e, i), so a run is reproducible for any number of workers.
+    """
+
+    def __init__(self, split_dir, batch_size=32, workers=os.cpu_count() or 1, seed=42,
+                 shuffle=True, augment=True, preprocessor=None):
+        """
+        Args:
+            split_dir (str): A <split>/<class>/ folder or a packed split (images.npy + index.csv),
+                as written by DatasetPreparer
+            workers (int): Worker processes; 0 loads and augments in the calling process
+            preprocessor (MelanomaImagePreprocessor): Supplies the augmentation pipeline
+        """
+        self.split_dir = split_dir
+        self.batch_size = batch_size
+        self.workers = workers
+        self.seed = seed
+        self.shuffle = shuffle
+        self.augment = augment
+        self.preprocessor = preprocessor or MelanomaImagePreprocessor()
+        self.packed = os.path.exists(os.path.join(split_dir, "images.npy"))
+        self.executor = None
+
+        if self.packed:
+            split = PackedSplit(split_dir)
+            self.sources = list(range(len(split)))
+            self.labels = np.asarray(split.labels, dtype=np.float32)
+        else:
+            items = list_directory_split(split_dir)
+            self.sources = [path for path, _ in items]
+            self.labels = np.array([label for _, label in items], dtype=np.float32)
+
+    def __len__(self):
+        """Batches per epoch"""
+        return (len(self.sources) + self.batch_size - 1) // self.batch_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shuts down the worker pool; a later epoch starts a new one"""
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def _get_executor(self):
+        # Workers receive the preprocessor and map the split once, not once per epoch
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_loader_worker,
+                                                initargs=(self.preprocessor, self.split_dir, self.packed))
+        return self.executor
+
+    def _batches(self, epoch):
+        order = np.arange(len(self.sources))
+        if self.shuffle:
+            order = np.random.default_rng([self.seed, epoch]).permutation(order)
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            sources = [self.sources[i] for i in indices]
+            seeds = [augmentation_seed(self.seed, epoch, int(i)) for i in indices]
+            yield sources, seeds, self.labels[indices]
+
+    def iter_epoch(self, epoch=0):
+        """Yields (images, labels) for one epoch: float32 (B, H, W, 3) in [0, 1] and float32 (B,)"""
+        if self.workers <= 0:
+            _set_loader_state(self.preprocessor, self.split_dir, self.packed)
+            for sources, seeds, labels in self._batches(epoch):
+                yield _load_batch(sources, seeds, self.augment), labels
+            return
+
+        executor = self._get_executor()
+        in_flight = deque()
+        try:
+            for sources, seeds, labels in self._batches(epoch):
+                in_flight.append((executor.submit(_load_batch, sources, seeds, self.augment), labels))
+                if len(in_flight) >= 2 * self.workers:
+                    future, batch_labels = in_flight.popleft()
+                    yield future.result(), batch_labels
+            while in_flight:
+                future, batch_labels = in_flight.popleft()
+                yield future.result(), batch_labels
+        finally:
+            # An epoch abandoned part-way leaves no queued work behind in the shared pool
+            for future, _ in in_flight:
+                future.cancel()
+
+    def repeat(self, epochs=None):
+        """Yields batches epoch after epoch, e.g. for model.fit(loader.repeat(), steps_per_epoch=len(loader))"""
+        epoch = 0
+        while epochs is None or epoch < epochs:
+            yield from self.iter_epoch(epoch)
+            epoch += 1
+
+
+def main(split_dir, batch_size=32, workers=os.cpu_count() or 1, epochs=1):
+    with AugmentationLoader(split_dir, batch_size=batch_size, workers=workers) as loader:
+        print(f"{len(loader.sources)} images in {split_dir} ({'packed' if loader.packed else 'directory'}), "
+              f"{len(loader)} batches of {batch_size}, {workers} workers")
+
+        for epoch in range(epochs):
+            images_seen = 0
+            start_time = time.perf_counter()
+            for images, _ in loader.iter_epoch(epoch):
+                images_seen += len(images)
+            elapsed = time.perf_counter() - start_time
+            rate = images_seen / elapsed if elapsed else 0.0
+            # The first epoch also pays for starting the workers
+            print(f"Epoch {epoch + 1}: {rate:.1f} images/sec, {rate / max(workers, 1):.1f} images/sec per core")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the throughput of on-the-fly augmentation")
+    parser.add_argument("--split", type=str, default="neural_network_data/train",
+                        help="Prepared split: <class>/ folders or a packed split")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (0 runs in the main process)")
+    parser.add_argument("--epochs", type=int, default=2)
+    args = parser.parse_args()
+
+    main(args.split, args.batch_size, args.workers, args.epochs)
@@ -0,0 +1,87 @@
+import os
+import random
+import argparse
+import numpy as np
+import cv2
+from data_transformer import ARTIFACT_ENGINES, MelanomaImagePreprocessor, StageTimer
+
+
+def sample_images(image_dir, count, seed=42):
+    """Decodes a random sample of images from image_dir as RGB arrays"""
+    filenames = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+    if len(filenames) > count:
+        filenames = random.Random(seed).sample(filenames, count)
+    images = []
+    for filename in filenames:
+        image = cv2.imread(os.path.join(image_dir, filename))
+        if image is not None:
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return images
+
+
+def psnr(reference, image):
+    mse = np.mean((reference.astype(np.float64) - image.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def ssim(reference, image):
+    """Mean SSIM over channels with the usual 11x11 Gaussian window"""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    x, y = reference.astype(np.float64), image.astype(np.float64)
+
+    def blur(img):
+        return cv2.GaussianBlur(img, (11, 11), 1.5)
+
+    mu_x, mu_y = blur(x), blur(y)
+    var_x = blur(x * x) - mu_x ** 2
+    var_y = blur(y * y) - mu_y ** 2
+    cov = blur(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+    return ssim_map.mean()
+
+
+def main(image_dir, count=200, target_size=(128, 128)):
+    if not os.path.isdir(image_dir):
+        print(f"Image directory not found: {image_dir}")
+        return
+    images = sample_images(image_dir, count)
+    print(f"Comparing artifact engines on {len(images)} images from {image_dir}")
+
+    # Every engine smooths the same color-normalized input; quality is measured against bilateral
+    reference = MelanomaImagePreprocessor(target_size)
+    inputs = [reference.normalize_color(cv2.resize(image, target_size)) for image in images]
+    reference_outputs = [reference.remove_artifacts(image) for image in inputs]
+
+    stage_means = {}
+    print(f"\n{'Engine':<16}{'Artifact ms':>12}{'Speedup':>10}{'PSNR (dB)':>11}{'SSIM':>8}")
+    baseline = None
+    for engine in ARTIFACT_ENGINES:
+        preprocessor = MelanomaImagePreprocessor(target_size, artifact_engine=engine)
+        preprocessor.stage_timer = StageTimer()
+        for image in images:
+            preprocessor.preprocess_image(image)
+        stage_means[engine] = preprocessor.stage_timer.mean_ms()
+
+        outputs = [preprocessor.remove_artifacts(image) for image in inputs]
+        quality_psnr = np.mean([psnr(ref, out) for ref, out in zip(reference_outputs, outputs)])
+        quality_ssim = np.mean([ssim(ref, out) for ref, out in zip(reference_outputs, outputs)])
+
+        artifact_ms = stage_means[engine]["artifact_removal"]
+        baseline = baseline or artifact_ms
+        print(f"{engine:<16}{artifact_ms:>12.3f}{baseline / artifact_ms:>9.1f}x{quality_psnr:>11.2f}{quality_ssim:>8.4f}")
+
+    print("\nMean ms per image by preprocess_image() stage:")
+    stages = list(next(iter(stage_means.values())))
+    print(f"{'Engine':<16}" + "".join(f"{stage:>18}" for stage in stages))
+    for engine, means in stage_means.items():
+        print(f"{engine:<16}" + "".join(f"{means[stage]:>18.3f}" for stage in stages))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare speed and quality of the artifact removal engines")
+    parser.add_argument("--dir", type=str, default="merged_data/images", help="Images to sample from")
+    parser.add_argument("--count", type=int, default=200, help="Number of sampled images")
+    parser.add_argument("--size", type=int, default=128, help="Target size images are resized to")
+    args = parser.parse_args()
+
+    main(args.dir, args.count, (args.size, args.size))
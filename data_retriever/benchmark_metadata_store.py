@@ -0,0 +1,51 @@
+import os
+import time
+import argparse
+import pandas as pd
+from metadata_store import load_metadata
+
+
+def time_load(load, repeats):
+    """Returns (best seconds, DataFrame) over several loads, so disk cache warm-up is not counted"""
+    best = float("inf")
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        df = load()
+        best = min(best, time.perf_counter() - start_time)
+    return best, df
+
+
+def main(metadata_dir="merged_data", repeats=5):
+    csv_path = os.path.join(metadata_dir, "metadata.csv")
+    parquet_path = os.path.join(metadata_dir, "metadata.parquet")
+    if not os.path.exists(parquet_path):
+        print(f"{parquet_path} not found, run the merge step first.")
+        return
+
+    columns = ["isic_id", "benign_malignant"]
+    cases = [
+        ("CSV, all columns", lambda: pd.read_csv(csv_path)),
+        ("CSV, projected", lambda: pd.read_csv(csv_path, usecols=columns)),
+        ("Parquet, all columns", lambda: load_metadata(parquet_path)),
+        ("Parquet, projected", lambda: load_metadata(parquet_path, columns=columns)),
+    ]
+
+    print(f"File size: CSV {os.path.getsize(csv_path) / 1e6:.2f} MB, "
+          f"Parquet {os.path.getsize(parquet_path) / 1e6:.2f} MB")
+    print(f"\n{'Load':<24}{'Time (ms)':>12}{'Memory (MB)':>14}{'Speedup':>10}")
+    baseline = None
+    for name, load in cases:
+        seconds, df = time_load(load, repeats)
+        baseline = baseline or seconds
+        memory = df.memory_usage(deep=True).sum() / 1e6
+        print(f"{name:<24}{seconds * 1000:>12.1f}{memory:>14.2f}{baseline / seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare loading merged metadata from CSV and from the Parquet store")
+    parser.add_argument("--metadata-dir", type=str, default="merged_data",
+                        help="Directory holding metadata.csv and metadata.parquet")
+    parser.add_argument("--repeats", type=int, default=5, help="Loads per case; the fastest is reported")
+    args = parser.parse_args()
+
+    main(args.metadata_dir, args.repeats)
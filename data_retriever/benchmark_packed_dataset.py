@@ -0,0 +1,77 @@
+import os
+import time
+import argparse
+import numpy as np
+from PIL import Image
+from packed_dataset import CLASS_NAMES, PackedSplit, pack_directory_split
+
+
+def to_model_input(images):
+    # Both paths end with the conversion a training step would do
+    return images.astype(np.float32) / 255.0
+
+
+def directory_epoch(class_root, batch_size):
+    """One pass over <split>/<class>/ folders, opening and decoding every file like flow_from_directory"""
+    files = []
+    for label_index, class_name in enumerate(CLASS_NAMES):
+        class_dir = os.path.join(class_root, class_name)
+        files += [(os.path.join(class_dir, f), label_index) for f in sorted(os.listdir(class_dir))
+                  if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    np.random.shuffle(files)
+
+    total = 0
+    for start in range(0, len(files), batch_size):
+        batch_files = files[start:start + batch_size]
+        images = np.stack([np.asarray(Image.open(path).convert("RGB")) for path, _ in batch_files])
+        total += len(to_model_input(images))
+    return total
+
+
+def packed_epoch(split, batch_size, epoch):
+    total = 0
+    for images, labels in split.iter_batches(batch_size, shuffle=True, seed=epoch):
+        total += len(to_model_input(images))
+    return total
+
+
+def main(directory_root, packed_root, split_name="train", batch_size=32, epochs=3):
+    class_root = os.path.join(directory_root, split_name)
+    split_dir = os.path.join(packed_root, split_name)
+
+    if not os.path.exists(os.path.join(split_dir, "images.npy")):
+        print(f"Packing {class_root} into {split_dir}...")
+        pack_directory_split(class_root, split_dir)
+    split = PackedSplit(split_dir)
+
+    print(f"\nBenchmarking {len(split)} images, batch size {batch_size}, {epochs} epochs")
+    print(f"{'Epoch':<8}{'Directory (s)':>16}{'Packed (s)':>14}{'Speedup':>10}")
+    directory_times, packed_times = [], []
+    for epoch in range(epochs):
+        start_time = time.perf_counter()
+        directory_epoch(class_root, batch_size)
+        directory_times.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        packed_epoch(split, batch_size, epoch)
+        packed_times.append(time.perf_counter() - start_time)
+
+        print(f"{epoch + 1:<8}{directory_times[-1]:>16.2f}{packed_times[-1]:>14.2f}"
+              f"{directory_times[-1] / packed_times[-1]:>9.1f}x")
+
+    print(f"\nMean epoch time: directory {np.mean(directory_times):.2f}s, packed {np.mean(packed_times):.2f}s "
+          f"({np.mean(directory_times) / np.mean(packed_times):.1f}x faster)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare epoch time of directory decoding vs the packed memmap format")
+    parser.add_argument("--directory-root", type=str, default="neural_network_data",
+                        help="Root of the <split>/<class>/ image folders")
+    parser.add_argument("--packed-root", type=str, default="neural_network_packed",
+                        help="Root of the packed splits (created from --directory-root if missing)")
+    parser.add_argument("--split", type=str, default="train", help="Split to benchmark")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.directory_root, args.packed_root, args.split, args.batch_size, args.epochs)
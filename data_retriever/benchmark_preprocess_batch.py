@@ -0,0 +1,81 @@
+import os
+import time
+import argparse
+import numpy as np
+import cv2
+from data_transformer import MelanomaImagePreprocessor
+
+
+def load_stack(image_dir, count, source_size, seed=42):
+    """Decodes up to `count` images and resizes them to a common source size, like a decoded batch"""
+    if not image_dir or not os.path.isdir(image_dir):
+        print("No image directory found, using random images")
+        rng = np.random.default_rng(seed)
+        return rng.integers(0, 256, size=(count, source_size[1], source_size[0], 3), dtype=np.uint8)
+
+    filenames = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))[:count]
+    images = []
+    for filename in filenames:
+        image = cv2.imread(os.path.join(image_dir, filename))
+        if image is not None:
+            images.append(cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), source_size))
+    return np.stack(images)
+
+
+class KernelsOnlyPreprocessor(MelanomaImagePreprocessor):
+    """Skips artifact removal, which stays per image in both paths, to time only the batched kernels"""
+
+    def remove_artifacts(self, image):
+        return image
+
+
+def compare(preprocessor, images, batch_size, repeats):
+    """Returns (per-image seconds, batched seconds, max |difference| in uint8 steps, differing values)"""
+    width, height = preprocessor.target_size
+    out = np.empty((batch_size, height, width, 3), dtype=np.float32)
+
+    per_image_times, batch_times = [], []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        expected = np.stack([preprocessor.preprocess_image(image) for image in images])
+        per_image_times.append(time.perf_counter() - start_time)
+
+        actual = np.empty_like(expected)
+        start_time = time.perf_counter()
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            # The same output buffer is reused for every batch
+            actual[start:start + len(batch)] = preprocessor.preprocess_batch(batch, out=out[:len(batch)])
+        batch_times.append(time.perf_counter() - start_time)
+
+    # Outputs are k/255, so one uint8 step is 1/255
+    diff = np.abs(actual - expected)
+    return min(per_image_times), min(batch_times), diff.max() * 255, np.count_nonzero(diff)
+
+
+def main(image_dir, count=256, batch_size=64, source_size=(256, 256), repeats=3):
+    images = load_stack(image_dir, count, source_size)
+    print(f"Benchmarking {len(images)} images of {source_size[0]}x{source_size[1]}, batch size {batch_size}")
+
+    print(f"\n{'Path':<28}{'Per image (ms)':>16}{'Batched (ms)':>14}{'Speedup':>10}{'Max diff':>10}")
+    for name, preprocessor in [("Resize + color + scale", KernelsOnlyPreprocessor(target_size=(128, 128))),
+                               ("Full preprocess_image", MelanomaImagePreprocessor(target_size=(128, 128)))]:
+        per_image, batched, max_diff, differing = compare(preprocessor, images, batch_size, repeats)
+        print(f"{name:<28}{per_image * 1000 / len(images):>16.3f}{batched * 1000 / len(images):>14.3f}"
+              f"{per_image / batched:>9.2f}x{max_diff:>10.2f}")
+        if differing:
+            print(f"  {differing} output values differ from the per-image path")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare preprocess_image() per image with preprocess_batch()")
+    parser.add_argument("--dir", type=str, default="merged_data/images",
+                        help="Images to benchmark on (random images are used if missing)")
+    parser.add_argument("--count", type=int, default=256, help="Number of images")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--source-size", type=int, nargs=2, default=[256, 256], metavar=("WIDTH", "HEIGHT"),
+                        help="Size every image is decoded to before preprocessing")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per path; the fastest is reported")
+    args = parser.parse_args()
+
+    main(args.dir, args.count, args.batch_size, tuple(args.source_size), args.repeats)
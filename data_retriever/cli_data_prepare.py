@@ -3,7 +3,6 @@ from data_transformer import MelanomaImagePreprocessor
 from data_final_prepare import DatasetPreparer
 import cv2
 import logging
-from tqdm import tqdm
 import numpy as np
 
 def process_cli_images():
@@ -34,11 +33,8 @@ def process_cli_images():
             
         logging.info(f"Processing {class_name} images...")
         
-        # Process images
-        processed_images, filenames = preprocessor.process_dataset(source_dir)
-        
-        # Save processed images
-        for img, fname in tqdm(zip(processed_images, filenames), desc=f"Saving {class_name}"):
+        # Process and save images one at a time
+        for fname, img in preprocessor.iter_dataset(source_dir):
             if img is not None:
                 # Convert from [0,1] range to [0,255] range
                 img = (img * 255).astype(np.uint8)
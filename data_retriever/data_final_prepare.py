@@ -4,14 +4,46 @@ import shutil
 import logging
 from sklearn.model_selection import train_test_split
 import random
-from tqdm import tqdm
+import argparse
+
+try:
+    from data_retriever.file_linker import LINK_STRATEGIES, materialize_many
+    from data_retriever.packed_dataset import write_packed_split
+    from data_retriever.dedup_index import CLUSTERS_FILENAME, load_cluster_groups
+    from data_retriever.metadata_store import load_metadata
+except ImportError:
+    from file_linker import LINK_STRATEGIES, materialize_many
+    from packed_dataset import write_packed_split
+    from dedup_index import CLUSTERS_FILENAME, load_cluster_groups
+    from metadata_store import load_metadata
+
+OUTPUT_FORMATS = ("directory", "packed")
+
 
 class DatasetPreparer:
-    def __init__(self, source_dir="data_transformed", target_dir="neural_network_data"):
+    def __init__(self, source_dir="data_transformed", target_dir="neural_network_data",
+                 output_format="directory", image_size=(128, 128), link_strategy="copy", workers=8):
+        """
+        Args:
+            output_format (str): "directory" copies images into <split>/<class>/ folders;
+                "packed" writes each split as one images.npy memmap plus index.csv
+            image_size (tuple): (width, height) images are stored at in packed mode
+            link_strategy (str): How directory mode materializes images: copy, hardlink,
+                symlink or reflink (links fall back to copy where unsupported)
+            workers (int): Threads used to materialize images
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
         self.source_dir = source_dir
         self.target_dir = target_dir
+        self.output_format = output_format
+        self.image_size = image_size
+        self.link_strategy = link_strategy
+        self.workers = workers
         self.metadata_path = os.path.join(source_dir, "metadata.csv")
         self.images_dir = os.path.join(source_dir, "images")
+        # isic_id -> duplicate cluster id, written by the merge step; missing means no known duplicates
+        self.cluster_groups = load_cluster_groups(os.path.join(source_dir, CLUSTERS_FILENAME))
         
         # Target directory structure
         self.train_dir = os.path.join(target_dir, "train")
@@ -32,16 +64,41 @@ class DatasetPreparer:
         
         # Create directory structure
         for split_dir in [self.train_dir, self.val_dir, self.test_dir]:
+            if self.output_format == "packed":
+                os.makedirs(split_dir, exist_ok=True)
+                continue
             for class_name in self.class_dirs.keys():
                 os.makedirs(os.path.join(split_dir, class_name), exist_ok=True)
         
         logging.info(f"Directory structure created: {self.target_dir}")
 
+    def _group_split(self, samples, train_ratio, val_ratio, assigned):
+        """
+        Splits samples so every duplicate cluster lands in a single split.
+        Whole clusters are split instead of images; clusters already placed for
+        another class (in `assigned`, cluster -> split name) keep that split.
+        """
+        groups = {}
+        for img_id in samples:
+            groups.setdefault(self.cluster_groups.get(img_id, img_id), []).append(img_id)
+
+        new_groups = [group for group in groups if group not in assigned]
+        if new_groups:
+            train_val_groups, test_groups = train_test_split(new_groups, test_size=1-train_ratio-val_ratio, random_state=42)
+            train_groups, val_groups = train_test_split(train_val_groups, test_size=val_ratio/(train_ratio+val_ratio), random_state=42)
+            for split_name, split_groups in [("train", train_groups), ("validation", val_groups), ("test", test_groups)]:
+                assigned.update((group, split_name) for group in split_groups)
+
+        split_samples = {"train": [], "validation": [], "test": []}
+        for group, members in groups.items():
+            split_samples[assigned[group]].extend(members)
+        return split_samples["train"], split_samples["validation"], split_samples["test"]
+
     def prepare_balanced_dataset(self, target_count=1000, train_ratio=0.7, val_ratio=0.15):
         """Creates balanced dataset and splits into train/val/test"""
         try:
-            # Read metadata
-            df = pd.read_csv(self.metadata_path)
+            # Read metadata; only the id and label are needed here
+            df = load_metadata(self.metadata_path, columns=['isic_id', 'benign_malignant'])
             logging.info(f"Metadata file read. Total records: {len(df)}")
             
             # Check CSV contents
@@ -75,15 +132,24 @@ class DatasetPreparer:
             logging.info(f"\nSelected malignant samples: {len(malignant_samples)}")
             logging.info(f"Selected benign samples: {len(benign_samples)}")
             
+            # Packed mode collects (image_id, class_name, source_path) per split and writes at the end
+            packed_entries = {"train": [], "validation": [], "test": []}
+            # Directory mode collects (source_path, target_path) pairs and materializes them together
+            file_pairs = []
+            # Duplicate cluster -> split it was assigned to, shared across classes
+            assigned_groups = {}
+            logging.info(f"Known duplicate clusters: {len(set(self.cluster_groups.values()))}")
+
             # Split dataset
             for class_name, samples in [("malignant", malignant_samples), ("benign", benign_samples)]:
                 if not samples:
                     logging.error(f"No samples found for class {class_name}!")
                     continue
                     
-                # Train/val/test split
-                train_val_samples, test_samples = train_test_split(samples, test_size=1-train_ratio-val_ratio, random_state=42)
-                train_samples, val_samples = train_test_split(train_val_samples, test_size=val_ratio/(train_ratio+val_ratio), random_state=42)
+                # Train/val/test split, keeping duplicates of the same image together
+                train_samples, val_samples, test_samples = self._group_split(
+                    samples, train_ratio, val_ratio, assigned_groups
+                )
                 
                 logging.info(f"\n{class_name} split distribution:")
                 logging.info(f"Train: {len(train_samples)}")
@@ -100,17 +166,28 @@ class DatasetPreparer:
                 for split_name, (split_dir, split_samples) in splits.items():
                     target_class_dir = os.path.join(split_dir, class_name)
                     
-                    for img_id in tqdm(split_samples, desc=f"Copying {class_name} {split_name} images"):
+                    for img_id in split_samples:
                         # Find image file
                         source_path = os.path.join(self.images_dir, f"{img_id}.jpg")
                         if not os.path.exists(source_path):
                             source_path = os.path.join(self.images_dir, f"{img_id}.png")
                         
-                        if os.path.exists(source_path):
-                            target_path = os.path.join(target_class_dir, os.path.basename(source_path))
-                            shutil.copy2(source_path, target_path)
-                        else:
+                        if not os.path.exists(source_path):
                             logging.warning(f"Image not found: {img_id}")
+                        elif self.output_format == "packed":
+                            packed_entries[split_name].append((img_id, class_name, source_path))
+                        else:
+                            target_path = os.path.join(target_class_dir, os.path.basename(source_path))
+                            file_pairs.append((source_path, target_path))
+
+            if file_pairs:
+                used = materialize_many(file_pairs, self.link_strategy, self.workers,
+                                        desc=f"Materializing images ({self.link_strategy})")
+                logging.info(f"Materialized {len(file_pairs)} images: {dict(used)}")
+
+            if self.output_format == "packed":
+                for split_dir in [self.train_dir, self.val_dir, self.test_dir]:
+                    write_packed_split(packed_entries[os.path.basename(split_dir)], split_dir, self.image_size)
             
             # Print statistics
             self._print_statistics()
@@ -125,12 +202,18 @@ class DatasetPreparer:
             split_name = os.path.basename(split_dir)
             logging.info(f"\n{split_name} statistics:")
             
+            if self.output_format == "packed":
+                labels = pd.read_csv(os.path.join(split_dir, "index.csv"))['label'].value_counts()
+                for class_name in self.class_dirs.keys():
+                    logging.info(f"{class_name}: {labels.get(class_name, 0)} images")
+                continue
+
             for class_name in self.class_dirs.keys():
                 class_dir = os.path.join(split_dir, class_name)
                 count = len([f for f in os.listdir(class_dir) if f.endswith(('.jpg', '.png'))])
                 logging.info(f"{class_name}: {count} images")
 
-def main():
+def main(output_format="directory", link_strategy="copy"):
     # Logging settings
     logging.basicConfig(
         level=logging.INFO,
@@ -138,9 +221,16 @@ def main():
     )
     
     # Create and run dataset preparer
-    preparer = DatasetPreparer()
+    preparer = DatasetPreparer(output_format=output_format, link_strategy=link_strategy)
     preparer.setup_directory_structure()
     preparer.prepare_balanced_dataset(target_count=1000)  # 1000 images per class
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Prepare balanced train/validation/test splits")
+    parser.add_argument("--format", type=str, choices=OUTPUT_FORMATS, default="directory",
+                        help="directory: <split>/<class>/ image copies; packed: one uint8 memmap per split")
+    parser.add_argument("--link", type=str, choices=LINK_STRATEGIES, default="copy",
+                        help="How images are placed into the split folders (links fall back to copy)")
+    args = parser.parse_args()
+
+    main(output_format=args.format, link_strategy=args.link)
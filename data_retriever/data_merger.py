@@ -1,8 +1,13 @@
 import os
+import time
 import shutil
 import pandas as pd
-from tqdm import tqdm
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+from data_retriever.file_linker import materialize_many
+from data_retriever.dedup_index import CLUSTERS_FILENAME, find_duplicate_clusters
+from data_retriever.metadata_store import save_metadata
 
 zip_directory = "downloaded_zips"
 # List of source directories
@@ -20,28 +25,83 @@ source_directories = [
 target_directory = "merged_data"
 # Directory where zip files are located
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
 
-def extract_zips():
+def _is_archive_noise(info):
+    """Folders and macOS resource-fork entries, which the pipeline never reads"""
+    return (info.is_dir() or info.filename.startswith("__MACOSX/")
+            or os.path.basename(info.filename).startswith("._"))
+
+
+def extraction_members(zip_ref):
+    """Archive members the pipeline reads: images and metadata.csv, without folders or macOS metadata"""
+    members = []
+    for info in zip_ref.infolist():
+        name = os.path.basename(info.filename)
+        if _is_archive_noise(info):
+            continue
+        if name.lower().endswith(IMAGE_EXTENSIONS) or name == "metadata.csv":
+            members.append(info)
+    return members
+
+
+def extract_archive(zip_path, extract_path):
     """
-    Extracts downloaded zip files
+    Extracts the members returned by extraction_members() into extract_path.
+    Archives whose members are all already present with the right sizes are skipped.
+    Returns (status, member_count, extracted_bytes, seconds).
+    """
+    start_time = time.perf_counter()
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = extraction_members(zip_ref)
+        if all(_is_extracted(info, extract_path) for info in members):
+            return "skipped", len(members), 0, time.perf_counter() - start_time
+
+        extracted_bytes = 0
+        for info in members:
+            zip_ref.extract(info, extract_path)
+            extracted_bytes += info.file_size
+    return "extracted", len(members), extracted_bytes, time.perf_counter() - start_time
+
+
+def _is_extracted(info, extract_path):
+    target_path = os.path.join(extract_path, info.filename)
+    return os.path.isfile(target_path) and os.path.getsize(target_path) == info.file_size
+
+
+def extract_zips(workers=4):
+    """
+    Extracts downloaded zip files, one archive per worker process.
+    Only images and metadata.csv are extracted.
     """
     print("\nExtracting zip files...")
-    
-    for source_dir in [os.path.basename(d) for d in source_directories]:
-        zip_path = os.path.join(zip_directory, f"{source_dir}.zip")
-        extract_path = os.path.join(zip_directory, source_dir)
-        
-        if not os.path.exists(zip_path):
-            print(f"Warning: {zip_path} not found, skipping...")
-            continue
-            
-        print(f"Extracting: {source_dir}")
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
-            print(f"Successfully extracted: {source_dir}")
-        except Exception as e:
-            print(f"Error: Problem occurred while extracting {source_dir}: {str(e)}")
+    jobs = {}
+
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for source_dir in [os.path.basename(d) for d in source_directories]:
+            zip_path = os.path.join(zip_directory, f"{source_dir}.zip")
+            extract_path = os.path.join(zip_directory, source_dir)
+
+            if not os.path.exists(zip_path):
+                print(f"Warning: {zip_path} not found, skipping...")
+                continue
+
+            jobs[executor.submit(extract_archive, zip_path, extract_path)] = source_dir
+
+        for future in as_completed(jobs):
+            source_dir = jobs[future]
+            try:
+                status, member_count, extracted_bytes, seconds = future.result()
+            except Exception as e:
+                print(f"Error: Problem occurred while extracting {source_dir}: {str(e)}")
+                continue
+            if status == "skipped":
+                print(f"Already extracted: {source_dir} ({member_count} files)")
+            else:
+                print(f"Successfully extracted: {source_dir} ({member_count} files, "
+                      f"{extracted_bytes / 1e6:.1f} MB in {seconds:.1f}s, "
+                      f"{extracted_bytes / 1e6 / max(seconds, 1e-6):.1f} MB/s)")
 
 def setup_target_directory(target_dir):
     """
@@ -60,13 +120,15 @@ def setup_target_directory(target_dir):
     print(f"Target directory created: {target_dir}")
     return target_image_dir
 
-def merge_images(source_dirs, target_image_dir):
+def merge_images(source_dirs, target_image_dir, link_strategy="copy", workers=8):
     """
-    Merges images from all source directories
+    Merges images from all source directories.
+    Images are materialized with the given link strategy (copy, hardlink, symlink, reflink)
+    on a thread pool; the first source directory containing a filename wins.
     """
     print("\nMerging images...")
     copied_images = set()  # To track copied images
-    total_copied = 0
+    file_pairs = []
     total_skipped = 0
     
     for source_dir in source_dirs:
@@ -80,20 +142,119 @@ def merge_images(source_dirs, target_image_dir):
         # List all images in directory
         images = [f for f in os.listdir(source_image_dir) if f.endswith(('.png', '.jpg', '.jpeg'))]
         
-        # Copy images with progress bar
-        for image in tqdm(images, desc=f"Processing: {os.path.basename(source_dir)}"):
+        for image in images:
             if image not in copied_images:
-                shutil.copy2(
+                file_pairs.append((
                     os.path.join(source_image_dir, image),
                     os.path.join(target_image_dir, image)
-                )
+                ))
                 copied_images.add(image)
-                total_copied += 1
             else:
                 total_skipped += 1
+
+    used = materialize_many(file_pairs, link_strategy, workers, desc=f"Merging images ({link_strategy})")
+    print(f"Materialized images: {dict(used)}")
+    total_copied = len(file_pairs) - used["failed"]
     
     return total_copied, total_skipped
 
+def zip_paths_for(source_dirs):
+    """Maps each source directory to the zip archive it is extracted from"""
+    return [f"{source_dir}.zip" for source_dir in source_dirs]
+
+
+def list_zip_members(zip_ref, extensions=IMAGE_EXTENSIONS):
+    """
+    Returns {basename: member_name} for archive members with the given extensions
+    """
+    members = {}
+    for info in zip_ref.infolist():
+        name = os.path.basename(info.filename)
+        if _is_archive_noise(info):
+            continue
+        if name.lower().endswith(extensions) and name not in members:
+            members[name] = info.filename
+    return members
+
+
+def merge_images_from_zips(zip_paths, target_image_dir, workers=4):
+    """
+    Merges images by reading them straight out of the archives into target_image_dir,
+    so no extracted copy is written. The first archive containing a filename wins, as in
+    merge_images(). Archives are read in parallel, one thread per archive.
+    """
+    print("\nMerging images from zip archives...")
+    copied_images = set()  # To track copied images
+    plan = {}
+    total_skipped = 0
+
+    # Decide which archive provides each filename from the central directories alone
+    for zip_path in zip_paths:
+        if not os.path.exists(zip_path):
+            print(f"Warning: {zip_path} not found, skipping...")
+            continue
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            members = list_zip_members(zip_ref)
+        plan[zip_path] = []
+        for name, member in members.items():
+            if name not in copied_images:
+                plan[zip_path].append((member, name))
+                copied_images.add(name)
+            else:
+                total_skipped += 1
+
+    def extract(position, zip_path):
+        copied = 0
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for member, name in tqdm(plan[zip_path], desc=f"Reading: {os.path.basename(zip_path)}",
+                                     position=position):
+                target_path = os.path.join(target_image_dir, name)
+                try:
+                    with zip_ref.open(member) as src, open(target_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                    # Keep the archive's timestamp so unchanged images look unchanged to later stages
+                    mtime = time.mktime(zip_ref.getinfo(member).date_time + (0, 0, -1))
+                    os.utime(target_path, (mtime, mtime))
+                    copied += 1
+                except Exception as e:
+                    print(f"Error: Could not read {member} from {zip_path}: {str(e)}")
+        return copied
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        total_copied = sum(executor.map(extract, range(len(plan)), list(plan)))
+
+    return total_copied, total_skipped
+
+
+def merge_metadata_from_zips(zip_paths, target_dir):
+    """
+    Merges the metadata.csv of every archive, read without extraction
+    """
+    print("\nMerging metadata files from zip archives...")
+    dataframes = []
+
+    for zip_path in zip_paths:
+        if not os.path.exists(zip_path):
+            print(f"Warning: {zip_path} not found, skipping...")
+            continue
+
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                member = list_zip_members(zip_ref, extensions=('metadata.csv',)).get("metadata.csv")
+                if member is None:
+                    print(f"Warning: {os.path.basename(zip_path)} has no metadata.csv, skipping...")
+                    continue
+                with zip_ref.open(member) as f:
+                    df = pd.read_csv(f)
+            df["source_collection"] = os.path.splitext(os.path.basename(zip_path))[0]
+            dataframes.append(df)
+            print(f"Read: {os.path.basename(zip_path)}/metadata.csv ({len(df)} rows)")
+        except Exception as e:
+            print(f"Error: Failed to read {os.path.basename(zip_path)}/metadata.csv: {str(e)}")
+
+    return save_merged_metadata(dataframes, target_dir)
+
+
 def merge_metadata(source_dirs, target_dir):
     """
     Merges metadata files from all source directories
@@ -110,11 +271,20 @@ def merge_metadata(source_dirs, target_dir):
             
         try:
             df = pd.read_csv(metadata_path)
+            df["source_collection"] = os.path.basename(source_dir)
             dataframes.append(df)
             print(f"Read: {os.path.basename(source_dir)}/metadata.csv ({len(df)} rows)")
         except Exception as e:
             print(f"Error: Failed to read {os.path.basename(source_dir)}/metadata.csv: {str(e)}")
-    
+
+    return save_merged_metadata(dataframes, target_dir)
+
+
+def save_merged_metadata(dataframes, target_dir):
+    """
+    Concatenates per-collection metadata, drops duplicate IDs and writes the typed
+    metadata.parquet plus metadata.csv
+    """
     if not dataframes:
         raise Exception("No metadata files could be read!")
     
@@ -123,35 +293,53 @@ def merge_metadata(source_dirs, target_dir):
     merged_df = merged_df.drop_duplicates(subset=['isic_id'], keep='first')
     
     # Save merged metadata
-    output_path = os.path.join(target_dir, "metadata.csv")
-    merged_df.to_csv(output_path, index=False)
-    
-    return len(merged_df)
+    return save_metadata(merged_df, target_dir)
 
-def main():
+def main(link_strategy="copy", from_zips=False):
+    """
+    Builds merged_data. With from_zips, images and metadata are read straight out of the
+    archives and nothing is extracted; otherwise archives are extracted first and images
+    are materialized with link_strategy.
+    Returns True on success and False if the merge failed.
+    """
     print("Starting Data Merge Process...")
     
     # Extract zip files
-    extract_zips()
+    if not from_zips:
+        extract_zips()
     
     # Prepare target directory
     target_image_dir = setup_target_directory(target_directory)
     
     try:
-        # Merge images
-        total_copied, total_skipped = merge_images(source_directories, target_image_dir)
-        
-        # Merge metadata
-        total_metadata_rows = merge_metadata(source_directories, target_directory)
+        if from_zips:
+            zip_paths = zip_paths_for(source_directories)
+            total_copied, total_skipped = merge_images_from_zips(zip_paths, target_image_dir)
+            total_metadata_rows = merge_metadata_from_zips(zip_paths, target_directory)
+        else:
+            # Merge images
+            total_copied, total_skipped = merge_images(source_directories, target_image_dir, link_strategy)
+            
+            # Merge metadata
+            total_metadata_rows = merge_metadata(source_directories, target_directory)
+
+        # Filenames and isic_ids only catch same-name copies; find re-released or re-encoded ones by content
+        print("\nLooking for duplicate images by content...")
+        clusters = find_duplicate_clusters(target_image_dir)
+        clusters.to_csv(os.path.join(target_directory, CLUSTERS_FILENAME), index=False)
         
         # Report results
         print("\nProcess Completed!")
         print(f"- Number of copied images: {total_copied}")
         print(f"- Number of skipped duplicate images: {total_skipped}")
         print(f"- Number of merged metadata rows: {total_metadata_rows}")
+        print(f"- Duplicate clusters: {clusters['cluster_id'].nunique()} "
+              f"({len(clusters)} images, {(clusters['match'] == 'near').sum()} near-duplicates)")
         print(f"\nResults saved to '{target_directory}' directory.")
         
     except Exception as e:
         print(f"\nERROR: An error occurred during the process: {str(e)}")
-        return
+        return False
+
+    return True
 
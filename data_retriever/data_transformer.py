@@ -3,13 +3,155 @@ import cv2
 import albumentations as A
 from sklearn.preprocessing import StandardScaler
 import os
-from typing import Tuple, List
+import json
+import time
+import zlib
+import random
+import hashlib
+import logging
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, List, Optional, Iterator, Iterable, Callable, Collection
+from PIL import Image
 from tqdm import tqdm
 
+try:
+    from data_retriever.image_headers import read_image_size
+except ImportError:
+    from image_headers import read_image_size
+
+# Per-process preprocessor and reusable chunk buffers used by process_dataset(workers > 1)
+_worker_preprocessor = None
+_worker_stack = None
+_worker_output = None
+
+ARTIFACT_ENGINES = ("bilateral", "fast_bilateral", "guided")
+
+# cv2.imread flags that decode a JPEG at 1/2, 1/4 or 1/8 scale in the DCT domain
+REDUCED_READ_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def init_worker(preprocessor):
+    """Process pool initializer shared by process_dataset() and AugmentationLoader workers"""
+    global _worker_preprocessor
+    _worker_preprocessor = preprocessor
+    # Parallelism comes from the process pool; avoid oversubscribing cores with OpenCV threads
+    cv2.setNumThreads(1)
+
+
+def image_seed(seed: Optional[int], filename: str) -> Optional[int]:
+    """
+    Derives a per-image augmentation seed from the run seed and the file name, so an image
+    gets the same augmentation regardless of worker count or which other files are present.
+    """
+    if seed is None:
+        return None
+    return (seed + zlib.crc32(filename.encode("utf-8"))) % (2 ** 32)
+
+
+def _process_chunk(image_dir, chunk, augment, seed):
+    """
+    Processes a list of filenames in a worker process. Readable images are resized into one
+    stack and run through preprocess_batch(); the uint8 stack and the float32 output buffer
+    are kept between chunks, so no per-image output array is allocated.
+    """
+    global _worker_stack, _worker_output
+    preprocessor = _worker_preprocessor
+    width, height = preprocessor.target_size
+    if _worker_stack is None or len(_worker_stack) < len(chunk):
+        _worker_stack = np.empty((len(chunk), height, width, 3), dtype=np.uint8)
+        _worker_output = np.empty((len(chunk), height, width, 3), dtype=np.float32)
+
+    loaded = []
+    for filename in chunk:
+        try:
+            image = preprocessor.read_image(os.path.join(image_dir, filename))
+            if image is not None:
+                _worker_stack[len(loaded)] = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), (width, height))
+                loaded.append(filename)
+        except Exception:
+            continue
+
+    try:
+        count = len(loaded)
+        seeds = [image_seed(seed, filename) for filename in loaded]
+        batch = preprocessor.preprocess_batch(_worker_stack[:count], out=_worker_output[:count],
+                                              augment=augment, seeds=seeds)
+        processed = dict(zip(loaded, batch))
+    except Exception:
+        # Fall back to one image at a time, so one bad image does not cost the whole chunk
+        processed = {}
+        for filename in loaded:
+            try:
+                processed[filename] = preprocessor.process_file(
+                    os.path.join(image_dir, filename), augment, image_seed(seed, filename)
+                )
+            except Exception:
+                continue
+    # Rows are views into the output buffer; they are copied when the result is sent back
+    return [(filename, processed.get(filename)) for filename in chunk]
+
+class StageTimer:
+    """
+    Collects per-stage durations from MelanomaImagePreprocessor.stage_timer.
+    With workers > 1 each process times its own copy, so use it with workers=1.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def __call__(self, stage: str, seconds: float):
+        self.totals[stage] += seconds
+        self.counts[stage] += 1
+
+    def mean_ms(self) -> dict:
+        """Mean milliseconds per call of each stage, in the order stages were first seen"""
+        return {stage: self.totals[stage] * 1000.0 / self.counts[stage] for stage in self.totals}
+
+
+def guided_filter(image: np.ndarray, radius: int, eps: float) -> np.ndarray:
+    """
+    Self-guided filter (He et al.) on each channel, built from box filters so its cost
+    does not grow with the radius. eps is on the [0, 1] intensity scale; edges whose
+    local variance is well above eps are preserved, flatter regions are smoothed.
+    """
+    src = image.astype(np.float32) / 255.0
+    size = (2 * radius + 1, 2 * radius + 1)
+    mean = cv2.boxFilter(src, -1, size)
+    variance = cv2.boxFilter(src * src, -1, size) - mean * mean
+    a = variance / (variance + eps)
+    b = mean - a * mean
+    smoothed = cv2.boxFilter(a, -1, size) * src + cv2.boxFilter(b, -1, size)
+    return np.clip(smoothed * 255.0 + 0.5, 0, 255).astype(np.uint8)
+
+
 class MelanomaImagePreprocessor:
-    def __init__(self, target_size: Tuple[int, int] = (128, 128)):
+    def __init__(self, target_size: Tuple[int, int] = (128, 128), artifact_engine: str = "bilateral",
+                 reduced_decode: bool = False):
+        """
+        Args:
+            target_size (tuple): (width, height) images are resized to
+            artifact_engine (str): Edge-preserving smoothing used by remove_artifacts():
+                "bilateral" (cv2.bilateralFilter), "fast_bilateral" (bilateral filter at
+                half resolution, then upsampled) or "guided" (box-filter guided filter)
+            reduced_decode (bool): Let process_file() decode at the largest 1/2, 1/4 or 1/8
+                scale that still covers target_size, instead of full resolution
+        """
+        if artifact_engine not in ARTIFACT_ENGINES:
+            raise ValueError(f"Unknown artifact engine: {artifact_engine}")
         self.target_size = target_size
+        self.reduced_decode = reduced_decode
         self.scaler = StandardScaler()
+
+        # Artifact removal settings
+        self.artifact_engine = artifact_engine
+        self.bilateral_params = {"d": 9, "sigmaColor": 75, "sigmaSpace": 75}
+        self.guided_params = {"radius": 4, "eps": 0.01}
+        self.morph_kernel_size = 3
+
+        # Optional callable(stage_name, seconds), e.g. a StageTimer, called for each preprocess_image() stage
+        self.stage_timer = None
         
         # Basic augmentation pipeline
         self.augmentation = A.Compose([
@@ -41,13 +183,27 @@ class MelanomaImagePreprocessor:
         normalized_rgb = cv2.cvtColor(normalized_lab, cv2.COLOR_LAB2RGB)
         return normalized_rgb
 
+    def _smooth(self, image: np.ndarray) -> np.ndarray:
+        """Edge-preserving noise reduction with the configured artifact engine"""
+        if self.artifact_engine == "fast_bilateral":
+            # Half the pixels and half the window: roughly 8x less work than full resolution
+            height, width = image.shape[:2]
+            small = cv2.resize(image, (max(width // 2, 1), max(height // 2, 1)), interpolation=cv2.INTER_AREA)
+            params = dict(self.bilateral_params)
+            params["d"] = max(params["d"] // 2, 1)
+            params["sigmaSpace"] = params["sigmaSpace"] / 2
+            return cv2.resize(cv2.bilateralFilter(small, **params), (width, height), interpolation=cv2.INTER_LINEAR)
+        if self.artifact_engine == "guided":
+            return guided_filter(image, **self.guided_params)
+        return cv2.bilateralFilter(image, **self.bilateral_params)
+
     def remove_artifacts(self, image: np.ndarray) -> np.ndarray:
         """Cleans artifacts from the image"""
-        # Apply bilateral filter to reduce noise while preserving edges
-        denoised = cv2.bilateralFilter(image, d=9, sigmaColor=75, sigmaSpace=75)
+        # Reduce noise while preserving edges
+        denoised = self._smooth(image)
         
         # Clean small artifacts using morphological operations
-        kernel = np.ones((3,3), np.uint8)
+        kernel = np.ones((self.morph_kernel_size, self.morph_kernel_size), np.uint8)
         cleaned = cv2.morphologyEx(denoised, cv2.MORPH_OPEN, kernel)
         
         return cleaned
@@ -56,51 +212,245 @@ class MelanomaImagePreprocessor:
         """Main preprocessing function"""
         try:
             # Resize image
-            image = cv2.resize(image, self.target_size)
+            image = self._timed("resize", cv2.resize, image, self.target_size)
             
             # Color normalization
-            image = self.normalize_color(image)
+            image = self._timed("color_normalize", self.normalize_color, image)
             
             # Artifact removal
-            image = self.remove_artifacts(image)
+            image = self._timed("artifact_removal", self.remove_artifacts, image)
             
             # Normalize pixel values to 0-1 range
-            image = image.astype(np.float32) / 255.0
+            image = self._timed("scale", lambda img: img.astype(np.float32) / 255.0, image)
             
             if augment:
-                augmented = self.augmentation(image=image)
-                image = augmented['image']
+                image = self._timed("augment", lambda img: self.augmentation(image=img)['image'], image)
             
             return image
         except Exception as e:
             print(f"Image processing error: {str(e)}")
             return None
 
-    def process_dataset(self, image_dir: str, augment: bool = False) -> Tuple[List[np.ndarray], List[str]]:
-        """Processes the entire dataset"""
-        processed_images = []
-        filenames = []
-        
+    def _timed(self, stage: str, func: Callable, *args):
+        """Runs one preprocessing stage, reporting its duration to stage_timer if one is set"""
+        if self.stage_timer is None:
+            return func(*args)
+        start_time = time.perf_counter()
+        result = func(*args)
+        self.stage_timer(stage, time.perf_counter() - start_time)
+        return result
+
+    def preprocess_batch(self, images: np.ndarray, out: Optional[np.ndarray] = None, augment: bool = False,
+                         seeds: Optional[List[Optional[int]]] = None) -> np.ndarray:
+        """
+        Batched preprocess_image() for an (N, H, W, 3) uint8 RGB stack.
+
+        Color conversion runs once over the whole stack, and the L-channel min-max
+        normalization and the final scaling to [0, 1] are NumPy operations across the batch.
+        Results are written into `out`, an (N, target_h, target_w, 3) float32 buffer that
+        can be reused between calls; one is allocated if it is not given.
+        With augment, seeds[i] (if given) seeds the augmentation of image i, as in process_file().
+        """
+        if images.ndim != 4 or images.shape[-1] != 3 or images.dtype != np.uint8:
+            raise ValueError(f"Expected an (N, H, W, 3) uint8 stack, got {images.shape} {images.dtype}")
+        width, height = self.target_size
+        shape = (len(images), height, width, 3)
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape or out.dtype != np.float32:
+            raise ValueError(f"Output buffer must be float32 with shape {shape}, got {out.shape} {out.dtype}")
+
+        # Resize
+        if images.shape[1:3] == (height, width):
+            batch = images
+        else:
+            batch = np.empty(shape, dtype=np.uint8)
+            for i, image in enumerate(images):
+                batch[i] = cv2.resize(image, self.target_size)
+
+        # Color normalization: the stack is converted as one tall image, since the
+        # conversion is per pixel
+        lab = cv2.cvtColor(batch.reshape(-1, width, 3), cv2.COLOR_RGB2LAB).reshape(shape)
+        l = lab[..., 0]
+        l_min = l.min(axis=(1, 2)).astype(np.float64)
+        l_max = l.max(axis=(1, 2)).astype(np.float64)
+        # Same scale/shift as cv2.normalize(..., 0, 255, NORM_MINMAX) per image. L is uint8, so
+        # the mapping is built once per image as a 256-entry table and applied with one gather.
+        # OpenCV applies scale/shift as a float32 fused multiply-add: exact in float64,
+        # rounded once to float32
+        value_range = l_max - l_min
+        scale = np.divide(255.0, value_range, out=np.zeros_like(value_range), where=value_range > np.finfo(float).eps)
+        shift = -l_min * scale
+        levels = np.arange(256, dtype=np.float64)
+        tables = (levels * scale.astype(np.float32).astype(np.float64)[:, None]
+                  + shift.astype(np.float32).astype(np.float64)[:, None]).astype(np.float32)
+        tables = np.clip(np.rint(tables), 0, 255).astype(np.uint8)
+        offsets = np.arange(len(lab), dtype=np.intp)[:, None, None] * 256
+        lab[..., 0] = tables.ravel().take(l + offsets)
+        batch = cv2.cvtColor(lab.reshape(-1, width, 3), cv2.COLOR_LAB2RGB).reshape(shape)
+
+        # Artifact removal works on neighbourhoods, so it stays per image
+        for i in range(len(batch)):
+            batch[i] = self.remove_artifacts(batch[i])
+
+        # Normalize pixel values to 0-1 range
+        np.divide(batch, np.float32(255.0), out=out, dtype=np.float32)
+
+        if augment:
+            for i in range(len(out)):
+                if seeds is not None and seeds[i] is not None:
+                    self.seed_augmentation(seeds[i])
+                out[i] = self.augmentation(image=out[i])['image']
+
+        return out
+
+    def params_fingerprint(self, augment: bool = False, seed: Optional[int] = None) -> str:
+        """Hash of every setting that affects preprocess_image() output, used to invalidate cached results"""
+        params = {
+            "target_size": list(self.target_size),
+            "reduced_decode": self.reduced_decode,
+            "artifact_engine": self.artifact_engine,
+            "bilateral_params": self.bilateral_params,
+            "guided_params": self.guided_params if self.artifact_engine == "guided" else None,
+            "morph_kernel_size": self.morph_kernel_size,
+            "augment": augment,
+            "augmentation": repr(self.augmentation) if augment else None,
+            "seed": seed,
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def seed_augmentation(self, seed: int):
+        """Seeds every RNG the augmentation pipeline may draw from"""
+        random.seed(seed)
+        np.random.seed(seed % (2 ** 32))
+        # Newer albumentations versions keep their own generator per Compose
+        if hasattr(self.augmentation, "set_random_seed"):
+            self.augmentation.set_random_seed(seed)
+
+    def read_image(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Reads an image as BGR. With reduced_decode, JPEGs are decoded at the largest power-of-two
+        reduction whose size is still at least target_size, based on the header dimensions.
+        """
+        if not self.reduced_decode:
+            return cv2.imread(image_path)
+        try:
+            width, height = read_image_size(image_path)
+        except Exception:
+            return cv2.imread(image_path)
+
+        for factor in (8, 4, 2):
+            if width // factor >= self.target_size[0] and height // factor >= self.target_size[1]:
+                return cv2.imread(image_path, REDUCED_READ_FLAGS[factor])
+        return cv2.imread(image_path)
+
+    def process_file(self, image_path: str, augment: bool = False, seed: Optional[int] = None) -> Optional[np.ndarray]:
+        """Reads one image from disk and preprocesses it. Returns None if it can't be read"""
+        image = self.read_image(image_path)
+        if image is None:
+            return None
+
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        if augment and seed is not None:
+            self.seed_augmentation(seed)
+        return self.preprocess_image(image, augment=augment)
+
+    def iter_dataset(self, image_dir: str, augment: bool = False, workers: int = 1,
+                     seed: Optional[int] = None, chunk_size: int = 64,
+                     only: Optional[Collection[str]] = None, mp_context=None) -> Iterator[Tuple[str, np.ndarray]]:
+        """
+        Yields (filename, processed_image) one at a time, in file name order.
+        With workers > 1, chunks of chunk_size files are dispatched to a process pool, where each
+        chunk goes through preprocess_batch() into a reused buffer. At most 2 * workers chunks
+        are in flight, so memory use does not grow with the dataset size.
+        If seed is given, each image is augmented with image_seed(seed, filename), so the
+        output does not depend on the number of workers. `only` restricts processing to
+        the given filenames. mp_context (a multiprocessing context) selects how workers are started.
+        """
         if not os.path.exists(image_dir):
             print(f"Error: Image directory not found: {image_dir}")
-            return [], []
+            return
 
-        image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        
-        for filename in tqdm(image_files, desc="Processing Images"):
-            image_path = os.path.join(image_dir, filename)
-            try:
-                image = cv2.imread(image_path)
-                if image is None:
+        image_files = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+        if only is not None:
+            only = set(only)
+            image_files = [f for f in image_files if f in only]
+
+        if workers <= 1:
+            for filename in tqdm(image_files, desc="Processing Images"):
+                try:
+                    processed_image = self.process_file(
+                        os.path.join(image_dir, filename), augment, image_seed(seed, filename)
+                    )
+                    
+                    if processed_image is not None:
+                        yield filename, processed_image
+                except Exception as e:
                     continue
-                
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                processed_image = self.preprocess_image(image, augment=augment)
-                
+            return
+
+        chunks = (image_files[i:i + chunk_size] for i in range(0, len(image_files), chunk_size))
+        in_flight = deque()
+
+        def drain(future):
+            chunk_results = future.result()
+            pbar.update(len(chunk_results))
+            for filename, processed_image in chunk_results:
                 if processed_image is not None:
-                    processed_images.append(processed_image)
-                    filenames.append(filename)
-            except Exception as e:
-                continue
+                    yield filename, processed_image
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self,),
+                                 mp_context=mp_context) as executor, \
+                tqdm(total=len(image_files), desc=f"Processing Images ({workers} workers)") as pbar:
+            for chunk in chunks:
+                in_flight.append(executor.submit(_process_chunk, image_dir, chunk, augment, seed))
+                if len(in_flight) >= 2 * workers:
+                    yield from drain(in_flight.popleft())
+            while in_flight:
+                yield from drain(in_flight.popleft())
+
+    def process_dataset(self, image_dir: str, augment: bool = False, workers: int = 1,
+                        seed: Optional[int] = None, chunk_size: int = 64) -> Tuple[List[np.ndarray], List[str]]:
+        """Processes the entire dataset into memory. Prefer iter_dataset() for large datasets"""
+        processed_images = []
+        filenames = []
+
+        for filename, processed_image in self.iter_dataset(image_dir, augment, workers, seed, chunk_size):
+            processed_images.append(processed_image)
+            filenames.append(filename)
         
         return processed_images, filenames
+
+
+def save_processed_images(image_stream: Iterable[Tuple[str, np.ndarray]], output_dir: str,
+                          on_saved: Optional[Callable[[str], None]] = None) -> Tuple[int, int]:
+    """
+    Writes each (filename, image) from a stream as soon as it arrives, converting the
+    [0, 1] float image back to uint8. on_saved(filename) is called after each successful
+    write. Returns (saved, failed) counts.
+
+    Each image is written to a temporary file that then replaces the output. Split images
+    hardlinked to an existing output keep their old contents instead of being rewritten in place.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    saved = 0
+    failed = 0
+
+    for filename, img in image_stream:
+        output_path = os.path.join(output_dir, filename)
+        tmp_path = os.path.join(output_dir, f".{filename}.tmp")
+        try:
+            img = (img * 255).astype(np.uint8)
+            image_format = Image.registered_extensions()[os.path.splitext(filename)[1].lower()]
+            Image.fromarray(img).save(tmp_path, format=image_format)
+            os.replace(tmp_path, output_path)
+            saved += 1
+            if on_saved is not None:
+                on_saved(filename)
+        except Exception as e:
+            logging.error(f"Saving error ({filename}): {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            failed += 1
+
+    return saved, failed
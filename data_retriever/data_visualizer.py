@@ -1,11 +1,19 @@
 import pandas as pd
+import matplotlib
+# Plots are only saved to files, and the pipeline draws them off the main thread
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import os
 from datetime import datetime
-from PIL import Image
-from tqdm import tqdm
+
+try:
+    from data_retriever.metadata_store import load_metadata, scan_image_dimensions
+except ImportError:
+    from metadata_store import load_metadata, scan_image_dimensions
+
+DIMENSIONS_CACHE = "image_dimensions.parquet"
 
 class DataVisualizer:
     def __init__(self, csv_path='merged_data/metadata.csv', output_dir='data_visual_repr', images_dir='merged_data/images'):
@@ -13,11 +21,11 @@ class DataVisualizer:
         Initialize the DataVisualizer with data source and output directory
         
         Args:
-            csv_path (str): Path to the metadata CSV file
+            csv_path (str): Path to the metadata CSV file; a newer metadata.parquet next to it is read instead
             output_dir (str): Directory to save visualizations
             images_dir (str): Directory containing the images
         """
-        self.data = pd.read_csv(csv_path)
+        self.data = load_metadata(csv_path)
         self.output_dir = output_dir
         self.images_dir = images_dir
         os.makedirs(output_dir, exist_ok=True)
@@ -168,16 +176,15 @@ class DataVisualizer:
         """Analyze and visualize the distribution of image dimensions"""
         print("\nAnalyzing image dimensions...")
         
-        # Collect image dimensions
-        dimensions = []
-        for idx, row in tqdm(self.data.iterrows(), total=len(self.data)):
-            image_path = os.path.join(self.images_dir, row['isic_id'] + '.jpg')
-            if os.path.exists(image_path):
-                try:
-                    with Image.open(image_path) as img:
-                        dimensions.append(img.size)
-                except Exception as e:
-                    print(f"Error: Could not read file {image_path} - {str(e)}")
+        # Header-only scan; sizes of unchanged images come from the cache. It lives with the plots
+        # because merged_data is rebuilt by every merge and removed by cleanup
+        cache_path = os.path.join(self.output_dir, DIMENSIONS_CACHE)
+        dimensions = scan_image_dimensions(self.images_dir, cache_path)
+        dimensions = dimensions[dimensions['isic_id'].isin(self.data['isic_id'])]
+        if dimensions.empty:
+            print(f"Warning: No images found in {self.images_dir}!")
+            return
+        dimensions = list(zip(dimensions['width'], dimensions['height']))
         
         # Split dimensions into separate lists
         widths, heights = zip(*dimensions)
@@ -0,0 +1,194 @@
+import os
+import logging
+import hashlib
+import numpy as np
+import pandas as pd
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+CLUSTERS_FILENAME = "duplicate_clusters.csv"
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so a 2D DCT is two matrix products"""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    return int("".join("1" if b else "0" for b in bits.flatten()), 2)
+
+
+def dhash(gray, hash_size=8):
+    """Difference hash: sign of horizontal gradients on a (hash_size+1) x hash_size thumbnail"""
+    pixels = np.asarray(gray.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(gray, hash_size=8):
+    """Perceptual hash: low-frequency 2D DCT coefficients of a 32x32 thumbnail compared to their median"""
+    pixels = np.asarray(gray.resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    low = (DCT_32 @ pixels @ DCT_32.T)[:hash_size, :hash_size].flatten()[1:]  # Skip the DC term
+    return _bits_to_int(low > np.median(low))
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def hash_image(path):
+    """Returns (sha256, phash, dhash) for an image file"""
+    with open(path, "rb") as f:
+        data = f.read()
+    with Image.open(path) as img:
+        # JPEG draft mode decodes at a reduced scale, which is plenty for a 32x32 thumbnail
+        img.draft("L", (64, 64))
+        gray = img.convert("L")
+    return hashlib.sha256(data).hexdigest(), phash(gray), dhash(gray)
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes under Hamming distance.
+    A radius search only descends into children whose edge distance lies within
+    [d - radius, d + radius], so lookups touch a small part of the tree.
+    """
+
+    def __init__(self):
+        self.root = None  # (hash, items, {distance: child})
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """Returns [(item, distance)] for every stored hash within radius of value"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.extend((item, distance) for item in items)
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:  # Path compression
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Keep the smaller id as root so cluster ids are stable between runs
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def find_duplicate_clusters(image_dir, max_phash_distance=6, max_dhash_distance=10, workers=8,
+                            extensions=('.png', '.jpg', '.jpeg')):
+    """
+    Groups images in image_dir that are byte-identical or perceptually near-identical.
+
+    Exact copies share a sha256. Near duplicates (re-encoded, resized or re-released
+    copies) are pairs within max_phash_distance bits on pHash, confirmed by dHash.
+    Only one image per sha256 goes into the BK-tree, and each is queried once, so the
+    search stays far below comparing all pairs.
+
+    Returns a DataFrame (isic_id, cluster_id, cluster_size, match) listing only images
+    that belong to a cluster of two or more.
+    """
+    filenames = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(extensions))
+    paths = [os.path.join(image_dir, f) for f in filenames]
+
+    def safe_hash(path):
+        try:
+            return hash_image(path)
+        except Exception as e:
+            logging.warning(f"Could not hash {path}: {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(tqdm(executor.map(safe_hash, paths), total=len(paths), desc="Hashing images"))
+
+    image_ids = [os.path.splitext(f)[0] for f in filenames]
+    clusters = UnionFind()
+    exact = set()
+    by_sha = {}
+    for image_id, hashed in zip(image_ids, hashes):
+        if hashed is None:
+            continue
+        representative = by_sha.setdefault(hashed[0], image_id)
+        if representative != image_id:
+            clusters.union(representative, image_id)
+            exact.update((representative, image_id))
+
+    tree = BKTree()
+    near = set()
+    dhashes = {}
+    for image_id, hashed in zip(image_ids, hashes):
+        if hashed is None or by_sha[hashed[0]] != image_id:
+            continue
+        sha, p, d = hashed
+        for other_id, _ in tree.search(p, max_phash_distance):
+            if hamming(d, dhashes[other_id]) <= max_dhash_distance:
+                clusters.union(other_id, image_id)
+                near.update((other_id, image_id))
+        tree.add(p, image_id)
+        dhashes[image_id] = d
+
+    members = {}
+    for image_id in clusters.parent:
+        members.setdefault(clusters.find(image_id), []).append(image_id)
+
+    rows = []
+    for cluster_id, cluster in sorted(members.items()):
+        if len(cluster) < 2:
+            continue
+        for image_id in sorted(cluster):
+            rows.append({
+                "isic_id": image_id,
+                "cluster_id": cluster_id,
+                "cluster_size": len(cluster),
+                "match": "near" if image_id in near else "exact",
+            })
+    return pd.DataFrame(rows, columns=["isic_id", "cluster_id", "cluster_size", "match"])
+
+
+def load_cluster_groups(csv_path):
+    """Returns {isic_id: cluster_id} from a duplicate_clusters.csv, or {} if it does not exist"""
+    if not os.path.exists(csv_path):
+        return {}
+    df = pd.read_csv(csv_path, dtype={"isic_id": str, "cluster_id": str})
+    return dict(zip(df["isic_id"], df["cluster_id"]))
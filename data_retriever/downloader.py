@@ -1,7 +1,16 @@
 import os
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
+try:
+    from data_retriever.preprocess_manifest import file_sha256
+except ImportError:
+    from preprocess_manifest import file_sha256
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
 # Download links and names of zip files from ISIC Archive
 dataset_info = [
     {
@@ -35,43 +44,100 @@ dataset_info = [
 ]
 
 
-def download_zip(url, save_path):
+class VerificationError(Exception):
+    """Raised when a downloaded file does not match its expected size or checksum"""
+
+
+def _total_size(response, resume_from):
+    """Returns the full size of the remote file, or 0 if the server doesn't say"""
+    content_range = response.headers.get("content-range", "")
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else 0
+    content_length = int(response.headers.get("content-length", 0))
+    return content_length + resume_from if content_length else 0
+
+
+def download_zip(url, save_path, chunk_size=DEFAULT_CHUNK_SIZE, retries=5, backoff=2.0,
+                 expected_size=None, sha256=None, timeout=60, position=0):
     """
     Downloads a zip file from the given URL and saves it to the specified path.
     Shows the download progress with a progress bar.
+
+    Data is written to save_path + ".part". After a failure, the next attempt resumes from
+    the end of the partial file with an HTTP Range request (servers that ignore Range restart
+    from zero). Attempts are retried with exponential backoff. The file is renamed into place
+    only after its size (and sha256, if given) has been verified.
+    """
+    part_path = save_path + ".part"
+
+    for attempt in range(retries + 1):
+        try:
+            resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+
+            with requests.get(url, stream=True, headers=headers, timeout=timeout) as response:
+                if response.status_code == 416 and resume_from:
+                    # Nothing left to fetch: the partial file is already complete
+                    total_size = expected_size or resume_from
+                else:
+                    response.raise_for_status()  # Catch any errors
+                    if resume_from and response.status_code != 206:
+                        resume_from = 0  # Server ignored the Range header
+
+                    total_size = _total_size(response, resume_from)
+
+                    # Save the file
+                    with open(part_path, 'ab' if resume_from else 'wb') as file, tqdm(
+                            desc=os.path.basename(save_path),
+                            total=total_size or None,
+                            initial=resume_from,
+                            unit='B',
+                            unit_scale=True,
+                            unit_divisor=1024,
+                            position=position,
+                            leave=True,
+                    ) as pbar:
+                        for data in response.iter_content(chunk_size=chunk_size):
+                            size = file.write(data)
+                            pbar.update(size)
+
+            _verify(part_path, expected_size or total_size, sha256)
+            os.replace(part_path, save_path)
+            return True
+
+        except VerificationError as e:
+            # A corrupt file can't be resumed; start over
+            print(f"Error: {os.path.basename(save_path)} failed verification: {str(e)}")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        except Exception as e:
+            print(f"Error: Problem occurred while downloading {url} "
+                  f"(attempt {attempt + 1}/{retries + 1}): {str(e)}")
+
+        if attempt < retries:
+            time.sleep(backoff ** attempt)
+
+    return False
+
+
+def _verify(path, expected_size, sha256):
+    actual_size = os.path.getsize(path)
+    if expected_size and actual_size != expected_size:
+        raise VerificationError(f"expected {expected_size} bytes, got {actual_size}")
+    if sha256 and file_sha256(path) != sha256.lower():
+        raise VerificationError("sha256 checksum mismatch")
+
+
+def main(datasets=dataset_info, download_dir="downloaded_zips", workers=4, chunk_size=DEFAULT_CHUNK_SIZE,
+         retries=5):
+    """
+    Downloads every dataset concurrently. Entries may carry optional "size" (bytes) and
+    "sha256" keys used to verify the file. The link can point at any HTTP server, e.g. a
+    local stand-in for testing.
+    Returns True when every dataset is present afterwards.
     """
-    try:
-        # Start download in stream mode
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Catch any errors
-
-        # Get file size
-        total_size = int(response.headers.get('content-length', 0))
-
-        # Save the file
-        with open(save_path, 'wb') as file, tqdm(
-                desc=os.path.basename(save_path),
-                total=total_size,
-                unit='B',
-                unit_scale=True,
-                unit_divisor=1024,
-        ) as pbar:
-            for data in response.iter_content(chunk_size=1024):
-                size = file.write(data)
-                pbar.update(size)
-
-        return True
-
-    except Exception as e:
-        print(f"Error: Problem occurred while downloading {url}: {str(e)}")
-        if os.path.exists(save_path):
-            os.remove(save_path)  # Delete incomplete file
-        return False
-
-
-def main():
     # Directory where downloaded files will be saved
-    download_dir = "downloaded_zips"
     os.makedirs(download_dir, exist_ok=True)
 
     print("Downloading zip files...")
@@ -79,26 +145,41 @@ def main():
     # Download each zip file
     success_count = 0
     skipped_count = 0
-    for i, dataset in enumerate(dataset_info, 1):
+    jobs = []
+    for i, dataset in enumerate(datasets, 1):
         zip_path = os.path.join(download_dir, f"{dataset['name']}.zip")
         
         # Check if file already exists
         if os.path.exists(zip_path):
-            print(f"\nSkipping file {i}/{len(dataset_info)}: {dataset['name']} (already exists)")
+            print(f"Skipping file {i}/{len(datasets)}: {dataset['name']} (already exists)")
             skipped_count += 1
             success_count += 1
             continue
 
-        print(f"\nDownloading file {i}/{len(dataset_info)}: {dataset['name']}")
-        if download_zip(dataset['link'], zip_path):
-            success_count += 1
+        jobs.append((dataset, zip_path))
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {
+            executor.submit(
+                download_zip, dataset['link'], zip_path,
+                chunk_size=chunk_size,
+                retries=retries,
+                expected_size=dataset.get('size'),
+                sha256=dataset.get('sha256'),
+                position=position,
+            ): dataset['name']
+            for position, (dataset, zip_path) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            if future.result():
+                success_count += 1
+            else:
+                print(f"Failed: {futures[future]}")
 
     print(f"\nProcess completed:")
-    print(f"- Total files: {len(dataset_info)}")
+    print(f"- Total files: {len(datasets)}")
     print(f"- Successfully downloaded: {success_count - skipped_count}")
     print(f"- Skipped (already existed): {skipped_count}")
-    print(f"- Failed: {len(dataset_info) - success_count}")
+    print(f"- Failed: {len(datasets) - success_count}")
     print(f"\nFiles saved to '{download_dir}' directory.")
-
-
-
+    return success_count == len(datasets)
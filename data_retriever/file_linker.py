@@ -0,0 +1,78 @@
+import os
+import shutil
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+LINK_STRATEGIES = ("copy", "hardlink", "symlink", "reflink")
+
+# Linux ioctl request that clones a file's extents (btrfs, XFS, overlayfs on those)
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """Creates dst as a copy-on-write clone of src. Raises OSError if the filesystem can't"""
+    import fcntl
+
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def materialize(src, dst, strategy="copy"):
+    """
+    Makes src available at dst using the given strategy.
+    hardlink, symlink and reflink fall back to a plain copy when the filesystem or
+    platform does not support them (e.g. across devices). Returns the strategy used.
+    """
+    if strategy not in LINK_STRATEGIES:
+        raise ValueError(f"Unknown link strategy: {strategy}")
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        if strategy == "hardlink":
+            os.link(src, dst)
+            return "hardlink"
+        if strategy == "symlink":
+            os.symlink(os.path.abspath(src), dst)
+            return "symlink"
+        if strategy == "reflink":
+            _reflink(src, dst)
+            return "reflink"
+    except (OSError, ImportError, NotImplementedError):
+        pass
+
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def materialize_many(pairs, strategy="copy", workers=8, desc="Materializing files"):
+    """
+    Materializes (src, dst) pairs on a thread pool, since the work is I/O bound.
+    Returns a Counter of the strategies actually used.
+    """
+    used = Counter()
+    pairs = list(pairs)
+
+    def run(pair):
+        try:
+            return materialize(pair[0], pair[1], strategy)
+        except Exception as e:
+            logging.error(f"Could not materialize {pair[0]} -> {pair[1]}: {str(e)}")
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in tqdm(executor.map(run, pairs), total=len(pairs), desc=desc):
+            used[result] += 1
+
+    if strategy != "copy" and used["copy"]:
+        logging.warning(f"{used['copy']} files fell back to copy (requested {strategy})")
+    return used
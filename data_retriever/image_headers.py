@@ -0,0 +1,45 @@
+import struct
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Start-of-frame markers carry the image size; C4, C8 and CC share the range but are not frames
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_size(f):
+    """Walks JPEG marker segments up to the first start-of-frame, skipping all entropy-coded data"""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":  # Markers may be padded with extra 0xFF bytes
+            byte = f.read(1)
+        if not byte:
+            raise ValueError("no start-of-frame marker found")
+
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Standalone markers have no length field
+            continue
+        (length,) = struct.unpack(">H", f.read(2))
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def read_image_size(path):
+    """
+    Returns (width, height) of an image from its header only.
+    JPEG and PNG headers are parsed directly; other formats go through PIL, which
+    also only reads the header until pixel data is requested.
+    """
+    with open(path, "rb") as f:
+        head = f.read(24)
+        if head[:2] == b"\xff\xd8":
+            return _jpeg_size(f)
+        if head[:8] == PNG_SIGNATURE and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+
+    with Image.open(path) as img:
+        return img.size
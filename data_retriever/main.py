@@ -1,16 +1,18 @@
 import os
 import logging
+import argparse
+import multiprocessing
+from functools import partial
 from datetime import datetime
-from data_retriever.downloader import main as download_main
+from data_retriever.downloader import main as download_main, dataset_info
 from data_retriever.data_merger import main as merge_main
-from data_retriever.data_transformer import MelanomaImagePreprocessor
+from data_retriever.data_transformer import MelanomaImagePreprocessor, save_processed_images
 from data_retriever.data_visualizer import DataVisualizer
+from data_retriever.preprocess_manifest import PreprocessManifest
 from data_retriever.dir_cleaner import main as clean_main
 from data_retriever.data_final_prepare import main as prepare_final_data
-import numpy as np
-from PIL import Image
+from data_retriever.pipeline_dag import Pipeline, Stage
 import shutil
-from tqdm import tqdm
 
 
 # Configure logging
@@ -47,76 +49,120 @@ def create_directory_structure():
         logging.info(f"Created directory: {directory}")
 
 
-def run_pipeline():
-    """Execute the complete data processing pipeline"""
+def download_stage():
+    # Raising keeps the stage from being stamped as done and stops everything downstream
+    if not download_main():
+        raise RuntimeError("Some datasets could not be downloaded")
+
+
+def merge_stage(extract=False):
+    if extract:
+        # Extract the archives, then hardlink the images so merged_data outlives cleanup of the extracted folders
+        merged = merge_main(link_strategy="hardlink", from_zips=False)
+    else:
+        # Images are read straight out of the archives, so nothing is extracted to disk
+        merged = merge_main(from_zips=True)
+    if not merged:
+        raise RuntimeError("Merging the downloaded datasets failed")
+
+
+def transform_stage():
+    preprocessor = MelanomaImagePreprocessor(target_size=(128, 128))
+    transformed_image_dir = os.path.join("data_transformed", "images")
+    os.makedirs(transformed_image_dir, exist_ok=True)
+
+    # Only preprocess images that are new, changed, or were made with other settings.
+    # Augmentation is not baked in here; AugmentationLoader applies fresh augmentations every epoch
+    manifest = PreprocessManifest(
+        os.path.join("data_transformed", "manifest.json"),
+        preprocessor.params_fingerprint(augment=False)
+    )
+    to_process, reused = manifest.plan("merged_data/images", transformed_image_dir)
+    logging.info(f"Preprocessing: reusing {reused} images, recomputing {len(to_process)}")
+
+    image_stream = preprocessor.iter_dataset(
+        "merged_data/images",
+        augment=False,
+        workers=os.cpu_count() or 1,
+        only=to_process,
+        # Visualize may be running on another thread; spawned workers don't inherit its locks as fork would
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+    # Save processed images as they are produced
+    saved, failed = save_processed_images(image_stream, transformed_image_dir, on_saved=manifest.record)
+    manifest.save()
+    logging.info(f"Saved {saved} processed images ({failed} failed), reused {reused}")
+
+    # Copy metadata files; split preparation also keeps each duplicate cluster inside one split
+    for metadata_file in ["metadata.csv", "metadata.parquet", "duplicate_clusters.csv"]:
+        shutil.copy2(os.path.join("merged_data", metadata_file), os.path.join("data_transformed", metadata_file))
+    logging.info("Metadata file copied")
+
+
+def visualize_stage():
+    visualizer = DataVisualizer(
+        csv_path='merged_data/metadata.csv',
+        output_dir='data_visual_repr',
+        images_dir='merged_data/images'
+    )
+
+    # Run all visualizations
+    visualizer.analyze_data()
+    visualizer.analyze_missing_values(threshold=50)
+    visualizer.analyze_key_features()
+    visualizer.analyze_image_dimensions()
+
+
+def prepare_stage():
+    prepare_final_data(link_strategy="hardlink")
+
+
+def build_pipeline(extract=False):
+    """
+    Declares the pipeline stages, what they read and write, and their order.
+    Visualization only needs the merged data, so it runs alongside transform and prepare.
+    With extract, the merge stage extracts the archives instead of streaming from them.
+    """
+    zip_paths = [os.path.join("downloaded_zips", f"{dataset['name']}.zip") for dataset in dataset_info]
+    merged = ["merged_data/images", "merged_data/metadata.csv", "merged_data/metadata.parquet",
+              "merged_data/duplicate_clusters.csv"]
+    transformed = ["data_transformed/images", "data_transformed/metadata.csv",
+                   "data_transformed/metadata.parquet", "data_transformed/duplicate_clusters.csv"]
+
+    return Pipeline([
+        Stage("download", download_stage, outputs=zip_paths),
+        Stage("merge", partial(merge_stage, extract), inputs=zip_paths, outputs=merged, after=["download"]),
+        Stage("transform", transform_stage, inputs=merged, outputs=transformed, after=["merge"]),
+        Stage("visualize", visualize_stage, inputs=merged, outputs=["data_visual_repr"], after=["merge"]),
+        Stage("prepare", prepare_stage, inputs=transformed, outputs=["neural_network_data"], after=["transform"]),
+        # Removes merged_data, so it waits for every stage that reads it
+        Stage("clean", clean_main, after=["visualize", "prepare"], always=True),
+    ])
+
+
+def run_pipeline(from_stage=None, only=None, force=False, clean=True, extract=False):
+    """
+    Execute the data processing pipeline.
+
+    Args:
+        from_stage (str): Re-run this stage and everything downstream of it
+        only (list): Run just these stages
+        force (bool): Re-run stages even when their outputs are up to date
+        clean (bool): Run the cleanup stage; without it merged_data is kept, so
+            later runs can skip merge, transform and visualize when nothing changed
+        extract (bool): Extract the archives in parallel and merge from the extracted
+            files, instead of reading images straight out of the zips
+    """
     try:
         # Setup logging
         setup_logging()
         logging.info("Starting Melanoma Detection Pipeline")
 
-
         # Create directory structure
         create_directory_structure()
 
-        # Step 1: Download datasets
-        logging.info("Step 1: Downloading datasets")
-        download_main()
-
-        # Step 2: Merge datasets
-        logging.info("Step 2: Merging datasets")
-        merge_main()
-
-        # Step 3: Transform images
-        logging.info("Step 3: Transforming images")
-        preprocessor = MelanomaImagePreprocessor(target_size=(128, 128))
-        processed_dataset, original_filenames = preprocessor.process_dataset(
-            "merged_data/images",
-            augment=True
-        )
-
-        # Save processed images
-        logging.info("Saving processed images...")
-        for img, filename in tqdm(zip(processed_dataset, original_filenames),
-                                desc="Saving Images",
-                                total=len(processed_dataset)):
-            try:
-                # Create output directory
-                os.makedirs(os.path.join("data_transformed", "images"), exist_ok=True)
-                output_path = os.path.join("data_transformed/images", filename)
-                img = (img * 255).astype(np.uint8)
-                img = Image.fromarray(img)
-                img.save(output_path)
-            except Exception as e:
-                logging.error(f"Saving error ({filename}): {str(e)}")
-
-        # Copy metadata.csv file
-        metadata_src = "merged_data/metadata.csv"
-        metadata_dst = os.path.join("data_transformed", "metadata.csv")
-        shutil.copy2(metadata_src, metadata_dst)
-        logging.info("Metadata file copied")
-
-        # Step 4: Generate visualizations
-        logging.info("Step 4: Generating visualizations")
-        visualizer = DataVisualizer(
-            csv_path='merged_data/metadata.csv',
-            output_dir='data_visual_repr',
-            images_dir='merged_data/images'
-        )
-
-        # Run all visualizations
-        visualizer.analyze_data()
-        visualizer.analyze_missing_values(threshold=50)
-        visualizer.analyze_key_features()
-        visualizer.analyze_image_dimensions()
-
-        # Step 5: Prepare final dataset for neural network
-        logging.info("Step 5: Preparing final dataset for neural network")
-        prepare_final_data()
-
-
-        # Step 6: Clean up directories
-        logging.info("Step 6: Cleaning up directories")
-        clean_main()
+        build_pipeline(extract).run(from_stage=from_stage, only=only, skip=() if clean else ("clean",), force=force)
 
         logging.info("Pipeline completed successfully!")
 
@@ -126,4 +172,17 @@ def run_pipeline():
 
 
 if __name__ == "__main__":
-    run_pipeline() 
\ No newline at end of file
+    stages = list(build_pipeline().stages)
+    parser = argparse.ArgumentParser(description="Run the melanoma data pipeline")
+    parser.add_argument("--from", dest="from_stage", choices=stages,
+                        help="Re-run this stage and every stage after it")
+    parser.add_argument("--only", nargs="+", choices=stages, help="Run just these stages")
+    parser.add_argument("--force", action="store_true", help="Ignore up-to-date outputs and re-run every stage")
+    parser.add_argument("--no-clean", action="store_true",
+                        help="Keep intermediate data so unchanged stages can be skipped next time")
+    parser.add_argument("--extract", action="store_true",
+                        help="Merge from extracted archives (extracted in parallel) instead of reading the zips directly")
+    args = parser.parse_args()
+
+    run_pipeline(from_stage=args.from_stage, only=args.only, force=args.force, clean=not args.no_clean,
+                 extract=args.extract)
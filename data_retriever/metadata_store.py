@@ -0,0 +1,128 @@
+import os
+import logging
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from data_retriever.image_headers import read_image_size
+except ImportError:
+    from image_headers import read_image_size
+
+# Low-cardinality text fields, stored as categoricals instead of one Python string per row
+CATEGORICAL_COLUMNS = [
+    "benign_malignant",
+    "sex",
+    "anatom_site_general",
+    "diagnosis",
+    "diagnosis_confirm_type",
+    "image_type",
+    "source_collection",
+]
+
+
+def to_typed(df):
+    """Returns df with compact dtypes: categorical labels, string ids and float32 ages"""
+    df = df.copy()
+    if "isic_id" in df.columns:
+        df["isic_id"] = df["isic_id"].astype(str)
+    if "age_approx" in df.columns:
+        df["age_approx"] = pd.to_numeric(df["age_approx"], errors="coerce").astype("float32")
+    # Concatenated collections can mix ints and strings in one column (e.g. lesion_id),
+    # which Parquet cannot store; any remaining text column is stored as strings
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].astype("string")
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def save_metadata(df, target_dir):
+    """
+    Writes metadata.parquet (typed, columnar) and metadata.csv into target_dir.
+    The CSV is kept for tools that read it directly; pipeline stages use load_metadata().
+    """
+    df = to_typed(df)
+    # CSV first, so the Parquet copy is never older than it (see resolve_metadata_path)
+    df.to_csv(os.path.join(target_dir, "metadata.csv"), index=False)
+    df.to_parquet(os.path.join(target_dir, "metadata.parquet"), index=False)
+    return len(df)
+
+
+def resolve_metadata_path(path):
+    """
+    Maps a directory, metadata.csv or metadata.parquet path to the file to read.
+    The Parquet copy is preferred unless the CSV next to it is newer, e.g. after a manual edit.
+    """
+    base = os.path.join(path, "metadata") if os.path.isdir(path) else os.path.splitext(path)[0]
+    parquet_path, csv_path = base + ".parquet", base + ".csv"
+    if os.path.exists(parquet_path) and (
+            not os.path.exists(csv_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)):
+        return parquet_path
+    return csv_path
+
+
+def load_metadata(path, columns=None):
+    """
+    Loads merged metadata with typed columns.
+
+    Args:
+        path (str): Directory holding the metadata, or a metadata.csv / metadata.parquet path
+        columns (list): Columns to read; with Parquet only these columns are decoded from disk
+    """
+    resolved = resolve_metadata_path(path)
+    if resolved.endswith(".parquet"):
+        return pd.read_parquet(resolved, columns=columns)
+    return to_typed(pd.read_csv(resolved, usecols=columns))
+
+
+def scan_image_dimensions(images_dir, cache_path, workers=16, extensions=('.png', '.jpg', '.jpeg')):
+    """
+    Returns a DataFrame (isic_id, width, height) for every image in images_dir.
+
+    Sizes are read from the file headers on a thread pool. They are cached in cache_path
+    (Parquet) keyed by file name, size and mtime, so later scans only read new or changed images.
+    """
+    columns = ["filename", "size", "mtime_ns", "width", "height"]
+    cache = pd.DataFrame(columns=columns)
+    if os.path.exists(cache_path):
+        try:
+            cache = pd.read_parquet(cache_path)
+        except Exception as e:
+            logging.warning(f"Could not read dimension cache {cache_path}, rebuilding it: {str(e)}")
+    cached = {row.filename: row for row in cache.itertuples(index=False)}
+
+    rows, to_read = [], []
+    with os.scandir(images_dir) as it:
+        for entry in it:
+            if not entry.is_file() or not entry.name.lower().endswith(extensions):
+                continue
+            stat = entry.stat()
+            hit = cached.get(entry.name)
+            if hit is not None and hit.size == stat.st_size and hit.mtime_ns == stat.st_mtime_ns:
+                rows.append(hit._asdict())
+            else:
+                to_read.append((entry.name, entry.path, stat.st_size, stat.st_mtime_ns))
+
+    def read(item):
+        filename, path, size, mtime_ns = item
+        try:
+            width, height = read_image_size(path)
+        except Exception as e:
+            logging.warning(f"Could not read the size of {path}: {str(e)}")
+            return None
+        return {"filename": filename, "size": size, "mtime_ns": mtime_ns, "width": width, "height": height}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rows += [row for row in executor.map(read, to_read) if row is not None]
+    logging.info(f"Image dimensions: {len(rows) - len(to_read)} cached, {len(to_read)} read from headers")
+
+    dimensions = pd.DataFrame(rows, columns=columns).astype(
+        {"size": "int64", "mtime_ns": "int64", "width": "int32", "height": "int32"}
+    )
+    if to_read or len(dimensions) != len(cache):
+        dimensions.to_parquet(cache_path, index=False)
+
+    dimensions["isic_id"] = dimensions["filename"].map(lambda f: os.path.splitext(f)[0])
+    return dimensions[["isic_id", "width", "height"]]
@@ -0,0 +1,102 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from PIL import Image
+from tqdm import tqdm
+
+CLASS_NAMES = ["benign", "malignant"]  # Same order as flow_from_directory's class_indices
+
+
+def write_packed_split(entries, split_dir, image_size=(128, 128), seed=42):
+    """
+    Packs a split into one contiguous uint8 array plus an index.
+
+    Args:
+        entries (list): (image_id, class_name, source_path) tuples
+        split_dir (str): Output directory; receives images.npy (N, H, W, 3) and index.csv
+        image_size (tuple): (width, height) every image is stored at
+        seed (int): Rows are shuffled once at write time, so readers can take contiguous
+            (zero-copy) slices as batches and only shuffle the batch order
+    """
+    os.makedirs(split_dir, exist_ok=True)
+    order = np.random.default_rng(seed).permutation(len(entries))
+    entries = [entries[i] for i in order]
+
+    images = np.lib.format.open_memmap(
+        os.path.join(split_dir, "images.npy"),
+        mode="w+",
+        dtype=np.uint8,
+        shape=(len(entries), image_size[1], image_size[0], 3),
+    )
+
+    rows = []
+    for image_id, class_name, source_path in tqdm(entries, desc=f"Packing {os.path.basename(split_dir)}"):
+        try:
+            with Image.open(source_path) as img:
+                img = img.convert("RGB")
+                if img.size != tuple(image_size):
+                    img = img.resize(image_size)
+                images[len(rows)] = np.asarray(img)
+        except Exception as e:
+            logging.warning(f"Could not pack {source_path}: {str(e)}")
+            continue
+        rows.append({
+            "row": len(rows),
+            "isic_id": image_id,
+            "label": class_name,
+            "label_index": CLASS_NAMES.index(class_name),
+        })
+
+    images.flush()
+    del images
+    if len(rows) < len(entries):
+        # Drop the unused tail left by unreadable images
+        packed = np.load(os.path.join(split_dir, "images.npy"))[:len(rows)]
+        np.save(os.path.join(split_dir, "images.npy"), packed)
+
+    pd.DataFrame(rows, columns=["row", "isic_id", "label", "label_index"]).to_csv(
+        os.path.join(split_dir, "index.csv"), index=False
+    )
+    logging.info(f"Packed {len(rows)} images into {split_dir}")
+    return len(rows)
+
+
+def pack_directory_split(class_root, split_dir, image_size=(128, 128)):
+    """Packs an existing <split>/<class>/ image folder, as written by DatasetPreparer"""
+    entries = []
+    for class_name in CLASS_NAMES:
+        class_dir = os.path.join(class_root, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                entries.append((os.path.splitext(filename)[0], class_name, os.path.join(class_dir, filename)))
+    return write_packed_split(entries, split_dir, image_size)
+
+
+class PackedSplit:
+    """
+    Memory-mapped view of a split written by write_packed_split().
+    Batches are contiguous slices of the memmap, so no file is opened or decoded per image.
+    """
+
+    def __init__(self, split_dir):
+        self.images = np.load(os.path.join(split_dir, "images.npy"), mmap_mode="r")
+        self.index = pd.read_csv(os.path.join(split_dir, "index.csv"))
+        self.labels = self.index["label_index"].to_numpy()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def iter_batches(self, batch_size=32, shuffle=False, seed=None):
+        """
+        Yields (images, labels) where images is a read-only uint8 (B, H, W, 3) slice.
+        With shuffle, the order of batches changes every call; rows were already shuffled
+        when the split was packed.
+        """
+        starts = np.arange(0, len(self), batch_size)
+        if shuffle:
+            starts = np.random.default_rng(seed).permutation(starts)
+        for start in starts:
+            yield self.images[start:start + batch_size], self.labels[start:start + batch_size]
@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def newest_mtime(path):
+    """Latest mtime of path and, for a directory, of everything below it (0 if missing)"""
+    if not os.path.exists(path):
+        return 0
+    newest = os.stat(path).st_mtime
+    if os.path.isdir(path):
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    newest = max(newest, newest_mtime(entry.path))
+                else:
+                    newest = max(newest, entry.stat(follow_symlinks=False).st_mtime)
+    return newest
+
+
+class Stage:
+    def __init__(self, name, run, inputs=(), outputs=(), after=(), always=False):
+        """
+        Args:
+            name (str): Stage name used by --from / --only
+            run (callable): Does the work; takes no arguments
+            inputs (list): Files or directories the stage reads
+            outputs (list): Files or directories the stage writes
+            after (list): Names of stages that must finish first
+            always (bool): Never skipped as fresh (e.g. cleanup)
+        """
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.always = always
+
+
+class Pipeline:
+    """
+    Runs stages as a dependency graph. Stages whose dependencies are done run
+    concurrently on a thread pool; a stage is skipped when all its outputs exist and
+    its last successful run is newer than every input.
+    """
+
+    def __init__(self, stages, state_dir=".pipeline_state", workers=2):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_dir = state_dir
+        self.workers = workers
+        for stage in stages:
+            for dependency in stage.after:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dependency}")
+
+    def _stamp_path(self, name):
+        return os.path.join(self.state_dir, f"{name}.done")
+
+    def is_fresh(self, stage):
+        """True when the stage's outputs exist and were produced after its inputs last changed"""
+        stamp_path = self._stamp_path(stage.name)
+        if stage.always or not os.path.exists(stamp_path):
+            return False
+        if not all(os.path.exists(path) for path in stage.outputs):
+            return False
+        return os.path.getmtime(stamp_path) >= max([newest_mtime(path) for path in stage.inputs], default=0)
+
+    def downstream(self, name):
+        """name plus every stage that depends on it, directly or indirectly"""
+        selected = {name}
+        changed = True
+        while changed:
+            changed = False
+            for stage in self.stages.values():
+                if stage.name not in selected and selected & set(stage.after):
+                    selected.add(stage.name)
+                    changed = True
+        return selected
+
+    def select(self, from_stage=None, only=None, skip=()):
+        """Names of the stages to consider, in declaration order"""
+        for name in [from_stage, *(only or []), *skip]:
+            if name is not None and name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+        if only:
+            selected = set(only)
+        elif from_stage:
+            selected = self.downstream(from_stage)
+        else:
+            selected = set(self.stages)
+        return [name for name in self.stages if name in selected and name not in skip]
+
+    def run(self, from_stage=None, only=None, skip=(), force=False):
+        """
+        Runs the selected stages. --from and --only stages are always re-run, together with
+        anything downstream of --from; other stages are skipped when fresh unless force is set.
+        Dependencies outside the selection are assumed to be satisfied.
+        """
+        selected = self.select(from_stage, only, skip)
+        forced = set(selected) if (force or only) else (self.downstream(from_stage) if from_stage else set())
+        pending = list(selected)
+        done = set()
+        running = {}
+        failure = None
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                progressed = False
+                for name in list(pending):
+                    if failure is not None:
+                        break
+                    stage = self.stages[name]
+                    if any(dependency in pending or dependency in running.values() for dependency in stage.after):
+                        continue
+                    pending.remove(name)
+                    progressed = True
+                    if name not in forced and self.is_fresh(stage):
+                        logging.info(f"Stage {name}: up to date, skipping")
+                        done.add(name)
+                        continue
+                    logging.info(f"Stage {name}: starting")
+                    running[executor.submit(self._run_stage, stage)] = name
+
+                if not running:
+                    if failure is not None or not pending:
+                        break
+                    if not progressed:
+                        raise ValueError(f"Dependency cycle between stages: {', '.join(pending)}")
+                    continue  # Stages skipped above may have unblocked others
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        seconds = future.result()
+                        logging.info(f"Stage {name}: finished in {seconds:.1f}s")
+                        done.add(name)
+                    except Exception as e:
+                        logging.error(f"Stage {name} failed: {str(e)}")
+                        failure = failure or e
+
+        if failure is not None:
+            raise failure
+        return done
+
+    def _run_stage(self, stage):
+        start_time = time.perf_counter()
+        stage.run()
+        # Touched after the outputs are complete, so its mtime marks the stage as fresh
+        with open(self._stamp_path(stage.name), "w") as f:
+            f.write(f"{time.time()}\n")
+        return time.perf_counter() - start_time
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import logging
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Returns the sha256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PreprocessManifest:
+    """
+    Tracks which source images already have an up-to-date preprocessed output.
+
+    Each entry is keyed by file name and stores the source content hash, the source size and
+    mtime (so unchanged files are not re-hashed), and the hash of the preprocessing parameters.
+    An output is reused only when both hashes match and the output file still exists.
+    """
+
+    def __init__(self, manifest_path, params_hash, save_every=500):
+        self.manifest_path = manifest_path
+        self.params_hash = params_hash
+        self.save_every = save_every
+        self.entries = {}
+        self.pending_hashes = {}
+        self.unsaved = 0
+
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r") as f:
+                    self.entries = json.load(f).get("entries", {})
+            except (ValueError, OSError) as e:
+                logging.warning(f"Could not read manifest {manifest_path}, rebuilding it: {str(e)}")
+
+    def _source_hash(self, source_path, stat, entry):
+        # Skip hashing when size and mtime show the file has not been touched
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return entry["source_hash"]
+        return file_sha256(source_path)
+
+    def plan(self, source_dir, output_dir, extensions=('.png', '.jpg', '.jpeg'), prune=False):
+        """
+        Compares source_dir against the manifest.
+        Returns (to_process, reused): file names that need preprocessing and the number of
+        existing outputs that can be kept. With prune, entries and outputs of sources that are
+        no longer in source_dir are removed; an empty or missing source_dir never prunes.
+        """
+        to_process = []
+        reused = 0
+        seen = set()
+
+        if not os.path.isdir(source_dir):
+            logging.warning(f"Source directory {source_dir} not found, nothing to preprocess")
+            return to_process, reused
+
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not entry.name.lower().endswith(extensions):
+                    continue
+                seen.add(entry.name)
+
+                stat = entry.stat()
+                manifest_entry = self.entries.get(entry.name)
+                source_hash = self._source_hash(entry.path, stat, manifest_entry)
+                self.pending_hashes[entry.name] = (source_hash, stat.st_size, stat.st_mtime_ns)
+
+                if (manifest_entry
+                        and manifest_entry["source_hash"] == source_hash
+                        and manifest_entry["params_hash"] == self.params_hash
+                        and os.path.exists(os.path.join(output_dir, entry.name))):
+                    reused += 1
+                else:
+                    to_process.append(entry.name)
+
+        removed_sources = set(self.entries) - seen
+        if prune and removed_sources and not seen:
+            # An empty source folder more likely means a failed merge than a deleted dataset
+            logging.warning(f"{source_dir} has no images, not pruning {len(removed_sources)} outputs")
+        elif prune and removed_sources:
+            removed = 0
+            for filename in removed_sources:
+                del self.entries[filename]
+                output_path = os.path.join(output_dir, filename)
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                    removed += 1
+            logging.info(f"Pruned {removed} outputs of source images no longer in {source_dir}")
+
+        return sorted(to_process), reused
+
+    def record(self, filename):
+        """Marks a file name from the last plan() as preprocessed with the current parameters"""
+        source_hash, size, mtime_ns = self.pending_hashes[filename]
+        self.entries[filename] = {
+            "source_hash": source_hash,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "params_hash": self.params_hash,
+        }
+        self.unsaved += 1
+        if self.unsaved >= self.save_every:
+            self.save()
+
+    def save(self):
+        """Writes the manifest atomically so an interrupted run never leaves it half-written"""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.entries}, f)
+        os.replace(tmp_path, self.manifest_path)
+        self.unsaved = 0
@@ -0,0 +1,38 @@
+import os
+import zipfile
+from data_retriever.data_merger import extract_archive
+
+
+def make_archive(path):
+    with zipfile.ZipFile(path, "w") as zip_ref:
+        zip_ref.writestr("ISIC_Test/ISIC_0000001.jpg", b"jpeg bytes")
+        zip_ref.writestr("ISIC_Test/metadata.csv", "isic_id\nISIC_0000001\n")
+        zip_ref.writestr("ISIC_Test/attribution.txt", "licence")
+        zip_ref.writestr("__MACOSX/ISIC_Test/._ISIC_0000001.jpg", b"resource fork")
+
+
+def test_extract_archive_writes_only_images_and_metadata(tmp_path):
+    zip_path = str(tmp_path / "ISIC_Test.zip")
+    extract_path = tmp_path / "extracted"
+    make_archive(zip_path)
+
+    status, member_count, extracted_bytes, _ = extract_archive(zip_path, str(extract_path))
+
+    assert status == "extracted"
+    assert member_count == 2
+    assert extracted_bytes == len(b"jpeg bytes") + len("isic_id\nISIC_0000001\n")
+    assert sorted(os.listdir(extract_path)) == ["ISIC_Test"]
+    assert sorted(os.listdir(extract_path / "ISIC_Test")) == ["ISIC_0000001.jpg", "metadata.csv"]
+
+
+def test_extract_archive_skips_already_extracted_archive(tmp_path):
+    zip_path = str(tmp_path / "ISIC_Test.zip")
+    make_archive(zip_path)
+    extract_archive(zip_path, str(tmp_path / "extracted"))
+
+    status, member_count, extracted_bytes, _ = extract_archive(zip_path, str(tmp_path / "extracted"))
+    assert (status, member_count, extracted_bytes) == ("skipped", 2, 0)
+
+    # A truncated member is extracted again
+    (tmp_path / "extracted" / "ISIC_Test" / "ISIC_0000001.jpg").write_bytes(b"jpeg")
+    assert extract_archive(zip_path, str(tmp_path / "extracted"))[0] == "extracted"
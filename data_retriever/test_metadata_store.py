@@ -0,0 +1,36 @@
+import os
+import pandas as pd
+from data_retriever.data_merger import merge_metadata
+from data_retriever.metadata_store import load_metadata
+
+
+def write_collection(root, name, rows):
+    collection_dir = os.path.join(root, name)
+    os.makedirs(collection_dir)
+    pd.DataFrame(rows).to_csv(os.path.join(collection_dir, "metadata.csv"), index=False)
+    return collection_dir
+
+
+def test_merge_collections_with_inconsistent_column_types(tmp_path):
+    # lesion_id is read as int64 in one collection and as text in the other
+    first = write_collection(tmp_path, "first", {
+        "isic_id": ["ISIC_0000001", "ISIC_0000002"],
+        "lesion_id": [1, 2],
+        "age_approx": [35, 40],
+        "benign_malignant": ["benign", "malignant"],
+    })
+    second = write_collection(tmp_path, "second", {
+        "isic_id": ["ISIC_0000003"],
+        "lesion_id": ["IL_3"],
+        "age_approx": ["unknown"],
+        "benign_malignant": ["benign"],
+    })
+    target_dir = tmp_path / "merged"
+    target_dir.mkdir()
+
+    assert merge_metadata([first, second], str(target_dir)) == 3
+
+    df = load_metadata(str(target_dir / "metadata.parquet"))
+    assert df["lesion_id"].tolist() == ["1", "2", "IL_3"]
+    assert df["source_collection"].tolist() == ["first", "first", "second"]
+    assert df["age_approx"].isna().tolist() == [False, False, True]
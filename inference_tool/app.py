@@ -1,52 +1,424 @@
+import io
 import os
+import time
+import queue
+import fnmatch
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.applications.efficientnet import preprocess_input
-from tensorflow.keras.preprocessing import image
+from prediction_cache import PredictionCache, file_fingerprint, hash_bytes
+from result_writers import WRITERS, make_record, open_writer
+from tflite_backend import TFLiteModel
 
+THRESHOLD = 0.6
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CLASS_NAMES = ("benign", "malignant")
+BACKENDS = ("auto", "keras", "tflite")
+TTA_VARIANTS = 8
 
-def predict_image(model, img_path, target_size=(224, 224)):
+
+def load_inference_model(model_path, backend="auto"):
+    """Loads a Keras model or a TFLite artifact; 'auto' picks the backend from the file extension"""
+    if backend == "auto":
+        backend = "tflite" if model_path.lower().endswith(".tflite") else "keras"
+    if backend == "tflite":
+        return TFLiteModel(model_path)
+
+    from tensorflow.keras.models import load_model
+    return load_model(model_path)
+
+
+def preprocess_input(batch):
+    # TensorFlow is imported on first use so --help and argument errors return immediately
+    from tensorflow.keras.applications.efficientnet import preprocess_input as efficientnet_preprocess
+    return efficientnet_preprocess(batch)
+
+
+def warm_up(model, batch_size=1, target_size=(224, 224)):
+    """Runs one dummy batch so graph tracing and tensor allocation happen before real images arrive"""
+    dummy = np.zeros((batch_size, target_size[0], target_size[1], 3), dtype=np.float32)
+    model.predict_on_batch(preprocess_input(dummy))
+
+
+def label_prediction(prediction, threshold=THRESHOLD):
+    return "Malignant" if prediction >= threshold else "Benign"
+
+
+def needs_tta(prediction, tta_band, threshold=THRESHOLD):
+    """True when TTA is enabled and the prediction lies within tta_band of the threshold"""
+    return tta_band is not None and abs(prediction - threshold) <= tta_band
+
+
+def tta_variants(images):
+    """
+    Stacks the 8 flip/rotate-90 variants of each (H, W, 3) image in images, i.e. every result
+    of the RandomRotate90, HorizontalFlip and VerticalFlip augmentations used in training.
+    Returns an (N * 8, H, W, 3) array in which rows i * 8 to i * 8 + 7 belong to images[i].
+    """
+    images = np.asarray(images)
+    variants = np.empty((len(images) * TTA_VARIANTS,) + images.shape[1:], dtype=images.dtype)
+    for k in range(4):
+        rotated = np.rot90(images, k, axes=(1, 2))
+        variants[2 * k::TTA_VARIANTS] = rotated
+        variants[2 * k + 1::TTA_VARIANTS] = rotated[:, :, ::-1]
+    return variants
+
+
+def tta_predict(model, images):
+    """Mean probability over the variants of each preprocessed image, in one forward pass"""
+    predictions = model.predict_on_batch(tta_variants(images))
+    return np.asarray(predictions, dtype=np.float32).reshape(len(images), TTA_VARIANTS).mean(axis=1)
+
+
+def predict_image(model, img_path, target_size=(224, 224), reduced_decode=False, tta_band=None):
     try:
-        img = image.load_img(img_path, target_size=target_size)
-        img_array = image.img_to_array(img)
+        img_array = decode_image(img_path, target_size, reduced_decode)
         img_array = preprocess_input(img_array)
         img_array = np.expand_dims(img_array, axis=0)
         prediction = model.predict(img_array)[0][0]
-        label = "Malignant" if prediction >= 0.6 else "Benign"
+        if needs_tta(prediction, tta_band):
+            prediction = tta_predict(model, img_array)[0]
+        label = label_prediction(prediction)
         return label, float(prediction)
     except Exception as e:
         return "Error", str(e)
 
 
-def main(model_path, image_dir):
+def cache_fingerprint(model_path, reduced_decode=False, tta_band=None):
+    """Identifies what a cached probability depends on: the model file, the decoding mode and TTA"""
+    fingerprint = file_fingerprint(model_path)
+    if reduced_decode:
+        fingerprint += ":reduced"
+    if tta_band is not None:
+        fingerprint += f":tta{tta_band}"
+    return fingerprint
+
+
+def scan_images(image_dir, recursive=False, pattern=None):
+    """
+    Lazily yields image paths under image_dir using os.scandir, so predictions can start
+    before the whole tree has been listed. Files are yielded in directory order (not sorted,
+    which would mean reading the whole listing first); subdirectories follow in name order.
+    """
+    subdirs = []
+    try:
+        with os.scandir(image_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if recursive:
+                        subdirs.append(entry.path)
+                elif entry.name.lower().endswith(VALID_EXTENSIONS):
+                    if pattern is None or fnmatch.fnmatch(entry.name, pattern):
+                        yield entry.path
+    except OSError as e:
+        print(f"Could not scan {image_dir}: {str(e)}")
+        return
+
+    for subdir in sorted(subdirs):
+        yield from scan_images(subdir, recursive, pattern)
+
+
+def label_from_dir(img_path):
+    """Returns 'benign' or 'malignant' if that is the image's parent folder name, else None"""
+    folder = os.path.basename(os.path.dirname(img_path)).lower()
+    return folder if folder in CLASS_NAMES else None
+
+
+def _timed_predict_image(model, img_path, reduced_decode=False, tta_band=None):
+    start_time = time.perf_counter()
+    label, confidence = predict_image(model, img_path, reduced_decode=reduced_decode, tta_band=tta_band)
+    return img_path, label, confidence, (time.perf_counter() - start_time) * 1000.0
+
+
+def decode_image(img_path, target_size=(224, 224), reduced_decode=False):
+    """
+    Decodes an image (path or file object) to a float32 (H, W, 3) array of target_size (height, width).
+    With reduced_decode, JPEGs are decoded at the largest 1/2, 1/4 or 1/8 DCT scale that is
+    still at least target_size, so a multi-megapixel photo is never fully decoded. The final
+    resize is the same nearest-neighbour resize as keras load_img.
+    """
+    if not reduced_decode:
+        from tensorflow.keras.preprocessing import image
+
+        img = image.load_img(img_path, target_size=target_size)
+        return image.img_to_array(img)
+
+    from PIL import Image
+
+    with Image.open(img_path) as img:
+        # draft() only applies to JPEG; other formats are decoded at full size
+        img.draft("RGB", (target_size[1], target_size[0]))
+        img = img.convert("RGB")
+        if img.size != (target_size[1], target_size[0]):
+            img = img.resize((target_size[1], target_size[0]), Image.NEAREST)
+        return np.asarray(img, dtype=np.float32)
+
+
+def load_record(img_path, target_size=(224, 224), cache=None, reduced_decode=False):
+    """
+    Reads and decodes one image. With a cache, the image bytes are hashed first and a
+    hit returns the stored confidence without decoding.
+    Returns a dict with keys: array, error, hash, cached, time_ms.
+    """
+    start_time = time.perf_counter()
+    record = {"array": None, "error": None, "hash": None, "cached": None}
+    try:
+        if cache is None:
+            record["array"] = decode_image(img_path, target_size, reduced_decode)
+        else:
+            with open(img_path, "rb") as f:
+                data = f.read()
+            record["hash"] = hash_bytes(data)
+            record["cached"] = cache.get(record["hash"])
+            if record["cached"] is None:
+                record["array"] = decode_image(io.BytesIO(data), target_size, reduced_decode)
+    except Exception as e:
+        record["error"] = str(e)
+    record["time_ms"] = (time.perf_counter() - start_time) * 1000.0
+    return record
+
+
+def iter_decoded(img_paths, target_size=(224, 224), workers=0, prefetch=64, cache=None, reduced_decode=False):
+    """
+    Yields (img_path, record) in input order, where record comes from load_record().
+    With workers > 0, a thread pool decodes ahead of the consumer. At most `prefetch`
+    images are queued at once, so the producer blocks instead of filling memory.
+    """
+    if not workers:
+        for img_path in img_paths:
+            yield img_path, load_record(img_path, target_size, cache, reduced_decode)
+        return
+
+    pending = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up if the consumer went away, otherwise wait for free space
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for img_path in img_paths:
+                    future = executor.submit(load_record, img_path, target_size, cache, reduced_decode)
+                    if not put((img_path, future)):
+                        future.cancel()
+                        break
+        finally:
+            put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            img_path, future = item
+            yield img_path, future.result()
+    finally:
+        stop.set()
+        producer.join()
+
+
+def predict_batch(model, img_paths, batch_size=32, target_size=(224, 224), workers=0, prefetch=64, cache=None,
+                  reduced_decode=False, tta_band=None):
+    """
+    Predicts images in batches, running one forward pass per batch.
+    Images are decoded into a single preallocated (batch_size, H, W, 3) buffer;
+    cache hits are answered without taking a slot in it.
+    With tta_band, images of the batch whose probability is within tta_band of the threshold
+    get a second forward pass over all their TTA variants together, and the averaged
+    probability replaces the single-pass one.
+    Yields (img_path, label, confidence, time_ms) in input order, with label and confidence
+    as returned by predict_image(). time_ms is the image's decode time plus its share of
+    the batch forward pass (and of the TTA pass, if it had one).
+    """
+    buffer = np.empty((batch_size, target_size[0], target_size[1], 3), dtype=np.float32)
+    chunk = []  # (img_path, result, time_ms) for the batch being filled
+    loaded = []  # (position in chunk, image hash) for images in the buffer
+
+    def flush():
+        if loaded:
+            start_time = time.perf_counter()
+            batch = preprocess_input(buffer[:len(loaded)])
+            predictions = np.asarray(model.predict_on_batch(batch), dtype=np.float32)[:, 0]
+            share_ms = np.full(len(loaded), (time.perf_counter() - start_time) * 1000.0 / len(loaded))
+
+            uncertain = [row for row, prediction in enumerate(predictions) if needs_tta(prediction, tta_band)]
+            if uncertain:
+                start_time = time.perf_counter()
+                predictions[uncertain] = tta_predict(model, batch[uncertain])
+                share_ms[uncertain] += (time.perf_counter() - start_time) * 1000.0 / len(uncertain)
+
+            for row, (i, image_hash) in enumerate(loaded):
+                prediction = float(predictions[row])
+                img_path, _, time_ms = chunk[i]
+                chunk[i] = (img_path, (label_prediction(prediction), prediction), time_ms + float(share_ms[row]))
+                if cache is not None:
+                    cache.put(image_hash, prediction)
+        results = [(img_path, label, confidence, time_ms) for img_path, (label, confidence), time_ms in chunk]
+        chunk.clear()
+        loaded.clear()
+        return results
+
+    for img_path, record in iter_decoded(img_paths, target_size, workers, prefetch, cache, reduced_decode):
+        if record["error"] is not None:
+            chunk.append((img_path, ("Error", record["error"]), record["time_ms"]))
+        elif record["cached"] is not None:
+            chunk.append((img_path, (label_prediction(record["cached"]), record["cached"]), record["time_ms"]))
+        else:
+            buffer[len(loaded)] = record["array"]
+            loaded.append((len(chunk), record["hash"]))
+            chunk.append((img_path, None, record["time_ms"]))
+
+        if len(loaded) == batch_size:
+            yield from flush()
+
+    yield from flush()
+
+
+def main(model_path, image_dir, batch_size=None, workers=0, prefetch=64, cache_path=None, cache_size=100000,
+         output_path=None, output_format=None, recursive=False, pattern=None, labels_from_dirs=False,
+         backend="auto", reduced_decode=False, tta_band=None, verbose=False):
     if not os.path.exists(model_path):
         print(f"Model path not found: {model_path}")
         return
 
-    model = load_model(model_path)
+    if not os.path.isdir(image_dir):
+        print(f"Image directory not found: {image_dir}")
+        return
+
+    start_time = time.perf_counter()
+    import tensorflow  # noqa: F401
+    import_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    model = load_inference_model(model_path, backend)
+    load_time = time.perf_counter() - start_time
     print(f"Model loaded from {model_path}")
 
-    valid_extensions = ('.jpg', '.jpeg', '.png')
-    image_files = [
-        os.path.join(image_dir, f)
-        for f in os.listdir(image_dir)
-        if f.lower().endswith(valid_extensions)
-    ]
+    start_time = time.perf_counter()
+    warm_up(model, batch_size=batch_size or 1)
+    warm_up_time = time.perf_counter() - start_time
+
+    if verbose:
+        print(f"Startup: import {import_time:.2f}s, model load {load_time:.2f}s, "
+              f"first inference {warm_up_time:.2f}s")
+
+    image_files = scan_images(image_dir, recursive=recursive, pattern=pattern)
 
-    if not image_files:
-        print("No valid images found in the directory.")
+    writer = None
+    done_paths = set()
+    if output_path:
+        writer, done_paths = open_writer(output_path, output_format)
+        if done_paths:
+            print(f"Resuming: skipping {len(done_paths)} images already in {output_path}")
+            image_files = (f for f in image_files if os.path.abspath(f) not in done_paths)
+
+    cache = None
+    if cache_path:
+        cache = PredictionCache(cache_path, cache_fingerprint(model_path, reduced_decode, tta_band),
+                                max_entries=cache_size)
+        if cache.stale_removed:
+            print(f"Cache: removed {cache.stale_removed} entries from a different model")
+
+    if batch_size or workers or cache:
+        results = predict_batch(model, image_files, batch_size=batch_size or 1,
+                                workers=workers, prefetch=prefetch, cache=cache, reduced_decode=reduced_decode,
+                                tta_band=tta_band)
+    else:
+        results = (_timed_predict_image(model, img_path, reduced_decode, tta_band) for img_path in image_files)
+
+    processed = 0
+    labeled = 0
+    correct = 0
+    start_time = time.perf_counter()
+    try:
+        for img_path, label, confidence, time_ms in results:
+            processed += 1
+            true_label = label_from_dir(img_path) if labels_from_dirs else None
+            if true_label and label != "Error":
+                labeled += 1
+                correct += int(label.lower() == true_label)
+
+            if writer:
+                writer.write(make_record(img_path, label, confidence, time_ms, THRESHOLD, true_label))
+            if label == "Error":
+                print(f"{os.path.basename(img_path)} → {label} ({confidence})")
+            else:
+                print(f"{os.path.basename(img_path)} → {label} (Confidence: {confidence:.2f})")
+    finally:
+        # Stop the decode threads before closing the cache they read from
+        results.close()
+        if writer:
+            writer.close()
+        if cache:
+            cache.close()
+    elapsed = time.perf_counter() - start_time
+
+    if not processed:
+        print("No new images to process." if done_paths else "No valid images found in the directory.")
         return
 
-    for img_path in image_files:
-        label, confidence = predict_image(model, img_path)
-        print(f"{os.path.basename(img_path)} → {label} (Confidence: {confidence:.2f})")
+    print(f"\nProcessed {processed} images in {elapsed:.2f}s "
+          f"({processed / elapsed if elapsed else 0.0:.1f} images/sec)")
+
+    if cache:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.1%}, {stats['entries']} entries)")
+
+    if labels_from_dirs:
+        if labeled:
+            print(f"Accuracy against folder labels: {correct / labeled:.4f} ({correct}/{labeled})")
+        else:
+            print("Accuracy against folder labels: no images under benign/ or malignant/ folders")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Melanoma Inference Script")
-    parser.add_argument("--model", type=str, required=True, help="Path to .keras model file")
+    parser.add_argument("--model", type=str, required=True, help="Path to .keras or .tflite model file")
     parser.add_argument("--dir", type=str, required=True, help="Directory containing images")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Run one forward pass per batch of this many images (default: one image per call)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Decode images on this many threads while the model runs (default: decode inline)")
+    parser.add_argument("--prefetch", type=int, default=64,
+                        help="Maximum number of decoded images waiting for the model")
+    parser.add_argument("--cache", type=str, default=None,
+                        help="SQLite file caching predictions by image content hash (default: no cache)")
+    parser.add_argument("--cache-size", type=int, default=100000,
+                        help="Maximum number of cached predictions before least recently used ones are evicted")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write results incrementally to this file; images already in it are skipped")
+    parser.add_argument("--format", type=str, choices=sorted(WRITERS), default=None,
+                        help="Output format (default: inferred from the --output extension, else jsonl)")
+    parser.add_argument("--recursive", action="store_true",
+                        help="Descend into subdirectories, e.g. the train/validation/test/<class> tree")
+    parser.add_argument("--glob", type=str, default=None,
+                        help="Only process files whose name matches this pattern, e.g. 'ISIC_*'")
+    parser.add_argument("--labels-from-dirs", action="store_true",
+                        help="Treat benign/ and malignant/ parent folders as ground truth and report accuracy")
+    parser.add_argument("--backend", type=str, choices=BACKENDS, default="auto",
+                        help="Execution backend (default: tflite for .tflite files, keras otherwise)")
+    parser.add_argument("--reduced-decode", action="store_true",
+                        help="Decode JPEGs at a reduced DCT scale close to the model input size (faster, less memory)")
+    parser.add_argument("--tta-band", type=float, default=None,
+                        help="Average flip/rotate-90 variants for images whose probability is within this "
+                             "distance of the threshold, e.g. 0.05 (default: no TTA)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print a startup timing breakdown (import, model load, first inference)")
     args = parser.parse_args()
 
-    main(args.model, args.dir)
+    main(args.model, args.dir, batch_size=args.batch_size, workers=args.workers, prefetch=args.prefetch,
+         cache_path=args.cache, cache_size=args.cache_size, output_path=args.output, output_format=args.format,
+         recursive=args.recursive, pattern=args.glob, labels_from_dirs=args.labels_from_dirs,
+         backend=args.backend, reduced_decode=args.reduced_decode, tta_band=args.tta_band, verbose=args.verbose)
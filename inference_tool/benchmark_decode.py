@@ -0,0 +1,91 @@
+import os
+import time
+import argparse
+import numpy as np
+from PIL import Image
+from app import THRESHOLD, decode_image, label_from_dir, load_inference_model, predict_batch, warm_up
+from export_model import sample_images
+
+
+def bitmap_bytes(img_path, target_size, reduced_decode):
+    """Size of the RGB bitmap the decoder produces before the final resize, i.e. the peak decode buffer"""
+    with Image.open(img_path) as img:
+        if reduced_decode:
+            img.draft("RGB", (target_size[1], target_size[0]))
+        width, height = img.size
+    return width * height * 3
+
+
+def time_decode(img_paths, target_size, reduced_decode):
+    """Returns mean decode milliseconds per image"""
+    decode_image(img_paths[0], target_size, reduced_decode)  # Import/first-call overhead is not counted
+    start_time = time.perf_counter()
+    for img_path in img_paths:
+        decode_image(img_path, target_size, reduced_decode)
+    return (time.perf_counter() - start_time) * 1000.0 / len(img_paths)
+
+
+def evaluate(model, img_paths, batch_size, reduced_decode):
+    """Returns ({img_path: probability}, accuracy against folder labels or None)"""
+    probabilities = {}
+    correct = 0
+    labeled = 0
+    for img_path, label, confidence, _ in predict_batch(model, img_paths, batch_size=batch_size,
+                                                        reduced_decode=reduced_decode):
+        if label == "Error":
+            continue
+        probabilities[img_path] = confidence
+        true_label = label_from_dir(img_path)
+        if true_label:
+            labeled += 1
+            correct += int(label.lower() == true_label)
+    return probabilities, (correct / labeled if labeled else None)
+
+
+def main(image_dir, samples=200, target_size=(224, 224), model_path=None, batch_size=32):
+    if not os.path.isdir(image_dir):
+        print(f"Image directory not found: {image_dir}")
+        return
+    img_paths = sample_images(image_dir, samples)
+    print(f"Decoding {len(img_paths)} images from {image_dir} to {target_size[1]}x{target_size[0]}")
+
+    print(f"\n{'Decode':<10}{'ms/image':>10}{'Bitmap MB (mean)':>18}{'Bitmap MB (max)':>17}")
+    times = {}
+    for name, reduced_decode in [("Full", False), ("Reduced", True)]:
+        times[name] = time_decode(img_paths, target_size, reduced_decode)
+        sizes = np.array([bitmap_bytes(p, target_size, reduced_decode) for p in img_paths]) / 1e6
+        print(f"{name:<10}{times[name]:>10.2f}{sizes.mean():>18.2f}{sizes.max():>17.2f}")
+    print(f"\nDecode speedup: {times['Full'] / times['Reduced']:.2f}x")
+
+    if not model_path:
+        print("No --model given, skipping the accuracy check.")
+        return
+
+    model = load_inference_model(model_path)
+    warm_up(model, batch_size)
+    full_probabilities, full_accuracy = evaluate(model, img_paths, batch_size, reduced_decode=False)
+    reduced_probabilities, reduced_accuracy = evaluate(model, img_paths, batch_size, reduced_decode=True)
+
+    def fmt_accuracy(accuracy):
+        return f"{accuracy:.4f}" if accuracy is not None else "n/a"
+
+    common = sorted(set(full_probabilities) & set(reduced_probabilities))
+    diffs = np.array([abs(full_probabilities[p] - reduced_probabilities[p]) for p in common])
+    flips = sum((full_probabilities[p] >= THRESHOLD) != (reduced_probabilities[p] >= THRESHOLD) for p in common)
+    print(f"\nAccuracy: full {fmt_accuracy(full_accuracy)}, reduced {fmt_accuracy(reduced_accuracy)}")
+    if len(common):
+        print(f"Probability difference: mean {diffs.mean():.4f}, max {diffs.max():.4f}")
+        print(f"Labels changed: {flips}/{len(common)} images")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare full and reduced-resolution JPEG decoding")
+    parser.add_argument("--dir", type=str, default="../data_retriever/neural_network_data/test",
+                        help="Images to sample (a <class>/ split enables the accuracy check)")
+    parser.add_argument("--samples", type=int, default=200, help="Number of sampled images")
+    parser.add_argument("--model", type=str, default=None,
+                        help="Model used to compare accuracy and probabilities (optional)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    main(args.dir, args.samples, model_path=args.model, batch_size=args.batch_size)
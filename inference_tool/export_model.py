@@ -0,0 +1,142 @@
+import os
+import time
+import random
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from tensorflow.keras.applications.efficientnet import preprocess_input
+from app import decode_image, label_from_dir, predict_batch, scan_images
+from tflite_backend import TFLiteModel
+
+
+def sample_images(image_dir, count, seed=42):
+    """Returns up to `count` image paths drawn from the whole tree under image_dir"""
+    # Sorted so the sample does not depend on the order the file system lists files in
+    img_paths = sorted(scan_images(image_dir, recursive=True))
+    if len(img_paths) > count:
+        img_paths = random.Random(seed).sample(img_paths, count)
+    return img_paths
+
+
+def convert(model, quantization, calibration_paths=None):
+    """Converts a Keras model to a TFLite flatbuffer with float16 or int8 weight/activation quantization"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if not calibration_paths:
+            raise ValueError("int8 quantization needs calibration images")
+
+        def representative_dataset():
+            for img_path in calibration_paths:
+                img_array = preprocess_input(decode_image(img_path))
+                yield [np.expand_dims(img_array, axis=0).astype(np.float32)]
+
+        # Inputs and outputs stay float32 so the artifact is a drop-in replacement
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    return converter.convert()
+
+
+def evaluate(model, img_paths, batch_size):
+    """Returns probabilities, accuracy against folder labels and throughput for one model"""
+    probabilities = {}
+    correct = 0
+    labeled = 0
+
+    # Warm up so graph tracing / tensor allocation is not counted
+    list(predict_batch(model, img_paths[:batch_size], batch_size=batch_size))
+
+    start_time = time.perf_counter()
+    for img_path, label, confidence, _ in predict_batch(model, img_paths, batch_size=batch_size):
+        if label == "Error":
+            continue
+        probabilities[img_path] = confidence
+        true_label = label_from_dir(img_path)
+        if true_label:
+            labeled += 1
+            correct += int(label.lower() == true_label)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "probabilities": probabilities,
+        "accuracy": correct / labeled if labeled else None,
+        "ms_per_image": elapsed * 1000.0 / max(len(probabilities), 1),
+    }
+
+
+def print_comparison(original, exported, original_size, exported_size):
+    common = sorted(set(original["probabilities"]) & set(exported["probabilities"]))
+    diffs = np.array([abs(original["probabilities"][p] - exported["probabilities"][p]) for p in common])
+    threshold_flips = sum(
+        (original["probabilities"][p] >= 0.6) != (exported["probabilities"][p] >= 0.6) for p in common
+    )
+
+    def fmt_accuracy(result):
+        return f"{result['accuracy']:.4f}" if result["accuracy"] is not None else "n/a"
+
+    print(f"\n{'':<22}{'Original':>12}{'Exported':>12}")
+    print(f"{'Model size (MB)':<22}{original_size / 1e6:>12.1f}{exported_size / 1e6:>12.1f}")
+    print(f"{'Accuracy':<22}{fmt_accuracy(original):>12}{fmt_accuracy(exported):>12}")
+    print(f"{'Latency (ms/image)':<22}{original['ms_per_image']:>12.2f}{exported['ms_per_image']:>12.2f}")
+    print(f"\nSpeedup: {original['ms_per_image'] / exported['ms_per_image']:.2f}x")
+    if len(common):
+        print(f"Probability difference: mean {diffs.mean():.4f}, max {diffs.max():.4f}")
+        print(f"Labels changed: {threshold_flips}/{len(common)} images")
+
+
+def main(model_path, output_path, quantization="float16", calibration_dir=None, calibration_samples=200,
+         eval_dir=None, eval_samples=500, batch_size=1):
+    if not os.path.exists(model_path):
+        print(f"Model path not found: {model_path}")
+        return
+
+    model = load_model(model_path)
+    print(f"Model loaded from {model_path}")
+
+    calibration_paths = None
+    if quantization == "int8":
+        calibration_paths = sample_images(calibration_dir, calibration_samples)
+        print(f"Calibrating on {len(calibration_paths)} images from {calibration_dir}")
+
+    print(f"Converting to TFLite ({quantization})...")
+    with open(output_path, "wb") as f:
+        f.write(convert(model, quantization, calibration_paths))
+    print(f"Exported model saved to {output_path}")
+
+    if not eval_dir or not os.path.isdir(eval_dir):
+        print("No evaluation directory found, skipping the accuracy/latency comparison.")
+        return
+
+    eval_paths = sample_images(eval_dir, eval_samples)
+    print(f"\nComparing on {len(eval_paths)} images from {eval_dir} (batch size {batch_size})...")
+    original = evaluate(model, eval_paths, batch_size)
+    exported = evaluate(TFLiteModel(output_path), eval_paths, batch_size)
+    print_comparison(original, exported, os.path.getsize(model_path), os.path.getsize(output_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a Keras melanoma model to quantized TFLite")
+    parser.add_argument("--model", type=str, required=True, help="Path to .keras model file")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Path of the .tflite file to write (default: next to the model)")
+    parser.add_argument("--quantization", type=str, choices=["float16", "int8"], default="float16",
+                        help="float16 halves the model size; int8 is smallest and fastest on CPU but needs calibration")
+    parser.add_argument("--calibration-dir", type=str, default="../data_retriever/neural_network_data/train",
+                        help="Prepared dataset split to draw int8 calibration images from")
+    parser.add_argument("--calibration-samples", type=int, default=200,
+                        help="Number of calibration images")
+    parser.add_argument("--eval-dir", type=str, default="../data_retriever/neural_network_data/test",
+                        help="Labelled split (<class>/ subfolders) used to compare the original and exported model")
+    parser.add_argument("--eval-samples", type=int, default=500, help="Number of comparison images")
+    parser.add_argument("--batch-size", type=int, default=1, help="Batch size used for the latency comparison")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.model)[0]}_{args.quantization}.tflite"
+    main(args.model, output, quantization=args.quantization, calibration_dir=args.calibration_dir,
+         calibration_samples=args.calibration_samples, eval_dir=args.eval_dir, eval_samples=args.eval_samples,
+         batch_size=args.batch_size)
@@ -0,0 +1,124 @@
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """Returns the sha256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Persistent SQLite cache of model outputs keyed by the sha256 of the image bytes and the
+    model fingerprint. A fingerprint is the model file hash, optionally followed by settings
+    such as ":reduced" (see app.cache_fingerprint), so entries for different settings of the
+    same model live side by side. Entries of a different model file are dropped when the
+    cache is opened. Once the cache holds more than max_entries, least recently used entries
+    are evicted, whatever their settings.
+    """
+
+    def __init__(self, db_path, model_fingerprint, max_entries=100000, commit_every=100):
+        self.model_fingerprint = model_fingerprint
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending_writes = 0
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Caches from before entries were keyed by fingerprint only hold one setting; start over
+        primary_key = [row[1] for row in sorted(self.conn.execute("PRAGMA table_info(predictions)"),
+                                                key=lambda row: row[5]) if row[5]]
+        if primary_key and primary_key != ["image_hash", "model_fingerprint"]:
+            self.conn.execute("DROP TABLE predictions")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "image_hash TEXT NOT NULL, "
+            "model_fingerprint TEXT NOT NULL, "
+            "confidence REAL NOT NULL, "
+            "last_access REAL NOT NULL, "
+            "PRIMARY KEY (image_hash, model_fingerprint))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON predictions (last_access)")
+
+        # Invalidate entries produced by any other model file; other settings of this model are kept
+        model_hash = model_fingerprint.split(":", 1)[0]
+        cursor = self.conn.execute(
+            "DELETE FROM predictions WHERE model_fingerprint != ? AND model_fingerprint NOT LIKE ?",
+            (model_hash, model_hash + ":%"),
+        )
+        self.stale_removed = cursor.rowcount
+        self.conn.commit()
+        self.entries = self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def get(self, image_hash):
+        """Returns the cached confidence for an image hash, or None on a miss"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT confidence FROM predictions WHERE image_hash = ? AND model_fingerprint = ?",
+                (image_hash, self.model_fingerprint),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE predictions SET last_access = ? WHERE image_hash = ? AND model_fingerprint = ?",
+                (time.time(), image_hash, self.model_fingerprint),
+            )
+            self._maybe_commit()
+            return row[0]
+
+    def put(self, image_hash, confidence):
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?)",
+                (image_hash, self.model_fingerprint, float(confidence), time.time()),
+            )
+            self.entries += cursor.rowcount
+            if self.entries > self.max_entries:
+                self._evict(self.entries - self.max_entries)
+            self._maybe_commit()
+
+    def _evict(self, count):
+        self.conn.execute(
+            "DELETE FROM predictions WHERE rowid IN "
+            "(SELECT rowid FROM predictions ORDER BY last_access ASC LIMIT ?)",
+            (count,),
+        )
+        self.entries -= count
+
+    def _maybe_commit(self):
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self.entries,
+                "stale_removed": self.stale_removed,
+            }
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
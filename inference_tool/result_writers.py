@@ -0,0 +1,183 @@
+import os
+import csv
+import json
+
+FIELDS = ["path", "label", "probability", "threshold", "error", "time_ms", "true_label"]
+
+
+def make_record(img_path, label, confidence, time_ms, threshold, true_label=None):
+    """Builds an output record from a (label, confidence) pair as returned by predict_image()"""
+    failed = label == "Error"
+    return {
+        "path": os.path.abspath(img_path),
+        "label": None if failed else label,
+        "probability": None if failed else float(confidence),
+        "threshold": threshold,
+        "error": str(confidence) if failed else None,
+        "time_ms": round(time_ms, 3),
+        "true_label": true_label,
+    }
+
+
+def _truncate_partial_line(path, chunk_size=64 * 1024):
+    """
+    Cuts a record left half-written by an interrupted run, so the file ends with its last
+    complete line and appended records start cleanly. Returns the number of bytes removed.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        # Scan backwards for the last newline
+        while end > 0:
+            start = max(end - chunk_size, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+            print(f"Removed a partially written record ({size - end} bytes) from the end of {path}")
+    return size - end
+
+
+class JsonlWriter:
+    """Appends one JSON object per line, flushed after every record"""
+
+    def __init__(self, path):
+        _truncate_partial_line(path)
+        self.file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def read_paths(path):
+        paths = set()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    paths.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    continue  # Not a record written by JsonlWriter
+        return paths
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    """Appends CSV rows, writing the header only for a new file, flushed after every record"""
+
+    def __init__(self, path):
+        _truncate_partial_line(path)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+        if is_new:
+            self.writer.writeheader()
+            self.file.flush()
+
+    @staticmethod
+    def read_paths(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            return {row["path"] for row in csv.DictReader(f) if row.get("path") and row.get("time_ms")}
+
+    def write(self, record):
+        self.writer.writerow(record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    Writes a Parquet dataset directory. Every `rows_per_part` records are written to a new,
+    closed part file, so an interrupted run keeps everything up to the last finished part.
+    """
+
+    def __init__(self, path, rows_per_part=1000):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self.rows = []
+        os.makedirs(path, exist_ok=True)
+        self.part_index = len(self._part_files(path))
+
+    @staticmethod
+    def _part_files(path):
+        return sorted(f for f in os.listdir(path) if f.startswith("part-") and f.endswith(".parquet"))
+
+    @staticmethod
+    def read_paths(path):
+        import pyarrow.parquet as pq
+
+        paths = set()
+        for part in ParquetWriter._part_files(path):
+            table = pq.read_table(os.path.join(path, part), columns=["path"])
+            paths.update(table.column("path").to_pylist())
+        return paths
+
+    def write(self, record):
+        self.rows.append(record)
+        if len(self.rows) >= self.rows_per_part:
+            self._write_part()
+
+    def _write_part(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self.rows:
+            return
+        schema = pa.schema([
+            ("path", pa.string()),
+            ("label", pa.string()),
+            ("probability", pa.float64()),
+            ("threshold", pa.float64()),
+            ("error", pa.string()),
+            ("time_ms", pa.float64()),
+            ("true_label", pa.string()),
+        ])
+        table = pa.Table.from_pylist(self.rows, schema=schema)
+        part_path = os.path.join(self.path, f"part-{self.part_index:05d}.parquet")
+        # Write under a temporary name so a crash never leaves a truncated part behind
+        pq.write_table(table, part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+        self.part_index += 1
+        self.rows = []
+
+    def close(self):
+        self._write_part()
+
+
+WRITERS = {
+    "jsonl": JsonlWriter,
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def infer_format(path):
+    extension = os.path.splitext(path.rstrip(os.sep))[1].lower().lstrip(".")
+    return extension if extension in WRITERS else "jsonl"
+
+
+def open_writer(path, output_format=None):
+    """
+    Opens a writer for the given format (inferred from the extension if not given).
+    Returns (writer, done_paths) where done_paths holds the paths already in the output.
+    Paths are read after the writer has dropped any partially written last record, so
+    an image whose record was cut off is processed again.
+    """
+    writer_class = WRITERS[output_format or infer_format(path)]
+    writer = writer_class(path)
+    return writer, writer_class.read_paths(path)
@@ -0,0 +1,190 @@
+import io
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from app import BACKENDS, decode_image, label_prediction, load_inference_model, preprocess_input, warm_up
+
+
+class MicroBatcher:
+    """
+    Groups concurrent prediction requests into micro-batches.
+    A batch is sent to the model once it holds max_batch_size images or the oldest
+    request has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(self, model, max_batch_size=16, max_wait_ms=10, target_size=(224, 224), latency_window=10000):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.target_size = target_size
+        self.requests = queue.Queue()
+
+        # Counters
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=latency_window)
+        self.total_requests = 0
+        self.total_errors = 0
+        self.total_batches = 0
+        self.total_batched = 0
+        self.max_queue_depth = 0
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def predict(self, img_bytes):
+        """Decodes an encoded image and waits for its batch. Returns (label, confidence) like predict_image()."""
+        start_time = time.perf_counter()
+        try:
+            img_array = decode_image(io.BytesIO(img_bytes), self.target_size)
+        except Exception as e:
+            self._record(start_time, error=True)
+            return "Error", str(e)
+
+        request = {"array": img_array, "done": threading.Event(), "result": None}
+        self.requests.put(request)
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.requests.qsize())
+        request["done"].wait()
+
+        label, confidence = request["result"]
+        self._record(start_time, error=label == "Error")
+        return label, confidence
+
+    def _record(self, start_time, error=False):
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start_time)
+            self.total_requests += 1
+            self.total_errors += int(error)
+
+    def _collect_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        buffer = np.empty((self.max_batch_size, self.target_size[0], self.target_size[1], 3), dtype=np.float32)
+        while True:
+            batch = self._collect_batch()
+            for i, request in enumerate(batch):
+                buffer[i] = request["array"]
+
+            try:
+                predictions = self.model.predict_on_batch(preprocess_input(buffer[:len(batch)]))
+                for i, request in enumerate(batch):
+                    prediction = float(predictions[i][0])
+                    request["result"] = (label_prediction(prediction), prediction)
+            except Exception as e:
+                for request in batch:
+                    request["result"] = ("Error", str(e))
+
+            with self.lock:
+                self.total_batches += 1
+                self.total_batched += len(batch)
+            for request in batch:
+                request["done"].set()
+
+    def stats(self):
+        with self.lock:
+            latencies_ms = np.array(self.latencies) * 1000.0
+            total_requests = self.total_requests
+            total_errors = self.total_errors
+            total_batches = self.total_batches
+            total_batched = self.total_batched
+            max_queue_depth = self.max_queue_depth
+
+        return {
+            "requests": total_requests,
+            "errors": total_errors,
+            "batches": total_batches,
+            "mean_batch_size": total_batched / total_batches if total_batches else 0.0,
+            "queue_depth": self.requests.qsize(),
+            "max_queue_depth": max_queue_depth,
+            "latency_p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+            "latency_p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+        }
+
+
+def make_handler(batcher):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send_json(200, batcher.stats())
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            if length <= 0:
+                self._send_json(400, {"label": "Error", "confidence": "Empty request body"})
+                return
+
+            label, confidence = batcher.predict(self.rfile.read(length))
+            self._send_json(400 if label == "Error" else 200, {"label": label, "confidence": confidence})
+
+    return InferenceHandler
+
+
+def main(model_path, host="127.0.0.1", port=8000, max_batch_size=16, max_wait_ms=10, backend="auto"):
+    if not os.path.exists(model_path):
+        print(f"Model path not found: {model_path}")
+        return
+
+    model = load_inference_model(model_path, backend)
+    warm_up(model)
+    print(f"Model loaded from {model_path}")
+
+    batcher = MicroBatcher(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Serving on http://{host}:{port} (max batch size: {max_batch_size}, max wait: {max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\nServer stopped. Final metrics: {json.dumps(batcher.stats())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Melanoma Inference Server")
+    parser.add_argument("--model", type=str, required=True, help="Path to .keras or .tflite model file")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--max-batch-size", type=int, default=16,
+                        help="Largest number of requests grouped into one forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=10,
+                        help="Longest time the first request in a batch waits for others to join")
+    parser.add_argument("--backend", type=str, choices=BACKENDS, default="auto",
+                        help="Execution backend (default: tflite for .tflite files, keras otherwise)")
+    args = parser.parse_args()
+
+    main(args.model, host=args.host, port=args.port,
+         max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, backend=args.backend)
@@ -0,0 +1,58 @@
+from app import cache_fingerprint
+from prediction_cache import PredictionCache
+
+
+def test_cache_fingerprint_depends_on_decoding_and_tta(tmp_path):
+    model_path = tmp_path / "model.tflite"
+    model_path.write_bytes(b"model weights")
+
+    fingerprints = {
+        cache_fingerprint(str(model_path)),
+        cache_fingerprint(str(model_path), reduced_decode=True),
+        cache_fingerprint(str(model_path), tta_band=0.05),
+        cache_fingerprint(str(model_path), reduced_decode=True, tta_band=0.05),
+    }
+    assert len(fingerprints) == 4
+    assert cache_fingerprint(str(model_path), reduced_decode=True) == \
+        cache_fingerprint(str(model_path), reduced_decode=True)
+
+
+def test_reduced_decode_does_not_reuse_full_decode_predictions(tmp_path):
+    model_path = tmp_path / "model.tflite"
+    model_path.write_bytes(b"model weights")
+    cache_path = str(tmp_path / "cache.sqlite")
+
+    cache = PredictionCache(cache_path, cache_fingerprint(str(model_path)))
+    cache.put("image-hash", 0.7)
+    cache.close()
+
+    cache = PredictionCache(cache_path, cache_fingerprint(str(model_path), reduced_decode=True))
+    assert cache.get("image-hash") is None
+    cache.close()
+
+
+def test_cache_keeps_entries_of_other_settings_for_the_same_model(tmp_path):
+    model_path = tmp_path / "model.tflite"
+    model_path.write_bytes(b"model weights")
+    cache_path = str(tmp_path / "cache.sqlite")
+
+    cache = PredictionCache(cache_path, cache_fingerprint(str(model_path)))
+    cache.put("image-hash", 0.7)
+    cache.close()
+
+    cache = PredictionCache(cache_path, cache_fingerprint(str(model_path), tta_band=0.05))
+    assert cache.stale_removed == 0
+    assert cache.get("image-hash") is None
+    cache.put("image-hash", 0.65)
+    cache.close()
+
+    cache = PredictionCache(cache_path, cache_fingerprint(str(model_path)))
+    assert cache.get("image-hash") == 0.7
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+    # A changed model file invalidates the entries of every setting
+    model_path.write_bytes(b"retrained weights")
+    cache = PredictionCache(cache_path, cache_fingerprint(str(model_path), reduced_decode=True))
+    assert cache.stale_removed == 2
+    cache.close()
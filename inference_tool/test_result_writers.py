@@ -0,0 +1,44 @@
+import csv
+import json
+from result_writers import make_record, open_writer
+
+
+def records(count):
+    return [make_record(f"img_{i}.jpg", "Benign", 0.1, 5.0, 0.6, "benign") for i in range(count)]
+
+
+def test_jsonl_resume_drops_partially_written_record(tmp_path):
+    path = tmp_path / "results.jsonl"
+    first, second, third = records(3)
+    path.write_text(json.dumps(first) + "\n" + json.dumps(second)[:-10], encoding="utf-8")
+
+    writer, done_paths = open_writer(str(path))
+    assert done_paths == {first["path"]}
+    writer.write(second)
+    writer.write(third)
+    writer.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["path"] for line in lines] == [first["path"], second["path"], third["path"]]
+
+
+def test_csv_resume_drops_row_cut_after_time_ms(tmp_path):
+    path = tmp_path / "results.csv"
+    first, second = records(2)
+    writer, _ = open_writer(str(path))
+    writer.write(first)
+    writer.write(second)
+    writer.close()
+    # Cut the last row inside its true_label column, after time_ms was written
+    content = path.read_bytes()
+    path.write_bytes(content[:-5])
+
+    writer, done_paths = open_writer(str(path))
+    assert done_paths == {first["path"]}
+    writer.write(second)
+    writer.close()
+
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["path"] for row in rows] == [first["path"], second["path"]]
+    assert rows[-1]["true_label"] == "benign"
@@ -0,0 +1,53 @@
+import os
+import threading
+import numpy as np
+
+
+class TFLiteModel:
+    """
+    Runs a .tflite model through the TensorFlow Lite interpreter with the same
+    predict()/predict_on_batch() calls the inference tool uses on Keras models.
+    The input tensor is resized whenever the batch size changes.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads or os.cpu_count())
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+        self.lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        input_shape = list(self.input_details["shape"])
+        input_shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_details["index"], input_shape)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = batch_size
+
+    def predict_on_batch(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self.lock:
+            if batch.shape[0] != self.batch_size:
+                self._resize(batch.shape[0])
+
+            # Fully integer models expect quantized input and return quantized output
+            input_dtype = self.input_details["dtype"]
+            if np.issubdtype(input_dtype, np.integer):
+                scale, zero_point = self.input_details["quantization"]
+                batch = np.round(batch / scale + zero_point).astype(input_dtype)
+
+            self.interpreter.set_tensor(self.input_details["index"], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_details["index"]).copy()
+
+        if np.issubdtype(output.dtype, np.integer):
+            scale, zero_point = self.output_details["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+    def predict(self, batch, verbose=0):
+        return self.predict_on_batch(batch)